@@ -0,0 +1,3 @@
+from .base import DynamoDBBackend, TableNotFound
+from .boto2 import Boto2Backend
+from .memory import MemoryBackend
@@ -0,0 +1,228 @@
+from collections import namedtuple
+from decimal import Decimal
+from time import sleep
+
+import boto3
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from botocore.config import Config
+
+from .base import DynamoDBBackend, TableNotFound, split_filter
+
+
+TableRef = namedtuple('TableRef', ['table_name', 'key_schema'])
+
+_OPERATORS = {
+    'eq': 'EQ',
+    'lt': 'LT',
+    'lte': 'LE',
+    'gt': 'GT',
+    'gte': 'GE',
+    'between': 'BETWEEN',
+    'beginswith': 'BEGINS_WITH',
+}
+
+# The most items DynamoDB accepts in a single batch request
+BATCH_WRITE_SIZE = 25
+BATCH_GET_SIZE = 100
+
+
+class AWSClientBackend(DynamoDBBackend):
+    """ A backend on a boto3 DynamoDB client.
+
+    boto3 clients are thread-safe, so one client and its connection pool
+    are shared by every thread of a block. Table references are
+    `TableRef` tuples of the table name and its key attribute names.
+    """
+
+    def __init__(self, region_name, aws_access_key_id=None,
+                 aws_secret_access_key=None, endpoint_url=None,
+                 timeout=None, pool_size=None, retry_mode='adaptive',
+                 max_attempts=None, client=None):
+        if client is None:
+            retries = {'mode': retry_mode}
+            if max_attempts is not None:
+                # Including the first attempt
+                retries['total_max_attempts'] = max_attempts
+            config_kwargs = {'retries': retries}
+            if pool_size is not None:
+                config_kwargs['max_pool_connections'] = pool_size
+            if timeout is not None:
+                config_kwargs['connect_timeout'] = timeout
+                config_kwargs['read_timeout'] = timeout
+            client = boto3.session.Session(
+                aws_access_key_id=aws_access_key_id,
+                aws_secret_access_key=aws_secret_access_key,
+                region_name=region_name,
+            ).client('dynamodb', endpoint_url=endpoint_url,
+                     config=Config(**config_kwargs))
+        self.client = client
+        self._serializer = TypeSerializer()
+        self._deserializer = TypeDeserializer()
+
+    def get_table(self, table_name):
+        try:
+            description = self.client.describe_table(TableName=table_name)
+        except self.client.exceptions.ResourceNotFoundException as e:
+            raise TableNotFound(table_name) from e
+        return self._table_ref(description['Table'])
+
+    def create_table(self, table_name, hash_key, range_key=None):
+        # Match the key types and throughput boto 2 creates tables with
+        key_schema = [{'AttributeName': hash_key, 'KeyType': 'HASH'}]
+        if range_key:
+            key_schema.append({'AttributeName': range_key,
+                               'KeyType': 'RANGE'})
+        description = self.client.create_table(
+            TableName=table_name,
+            KeySchema=key_schema,
+            AttributeDefinitions=[
+                {'AttributeName': key['AttributeName'],
+                 'AttributeType': 'S'} for key in key_schema],
+            ProvisionedThroughput={
+                'ReadCapacityUnits': 5,
+                'WriteCapacityUnits': 5,
+            })
+        return self._table_ref(description['TableDescription'])
+
+    def table_status(self, table):
+        return self.client.describe_table(
+            TableName=table.table_name)['Table']['TableStatus']
+
+    def key_schema(self, table):
+        return list(table.key_schema)
+
+    def batch_write(self, table, items):
+        for start in range(0, len(items), BATCH_WRITE_SIZE):
+            request_items = {table.table_name: [
+                {'PutRequest': {'Item': self._serialize(item)}}
+                for item in items[start:start + BATCH_WRITE_SIZE]]}
+            attempt = 0
+            while request_items:
+                if attempt:
+                    sleep(min(0.05 * 2 ** attempt, 5))
+                response = self.client.batch_write_item(
+                    RequestItems=request_items)
+                request_items = response.get('UnprocessedItems')
+                attempt += 1
+
+    def stored_item(self, table, item):
+        return self._deserialize(self._serialize(item))
+
+    def query(self, table, query_dict):
+        query_dict = dict(query_dict)
+        limit = query_dict.pop('limit', None)
+        kwargs = {
+            'TableName': table.table_name,
+            'ScanIndexForward': not query_dict.pop('reverse', False),
+        }
+        kwargs.update(self._projection(query_dict.pop('attributes', None)))
+        kwargs['KeyConditions'] = self._conditions(query_dict)
+        return self._paginate(self.client.query, kwargs, limit)
+
+    def get_item(self, table, key_attrs, attributes=None, consistent=False):
+        response = self.client.get_item(
+            TableName=table.table_name,
+            Key=self._serialize(key_attrs),
+            ConsistentRead=consistent,
+            **self._projection(attributes, select=False))
+        if 'Item' not in response:
+            return None
+        return self._deserialize(response['Item'])
+
+    def batch_get(self, table, keys, attributes=None):
+        items = []
+        for start in range(0, len(keys), BATCH_GET_SIZE):
+            request = {'Keys': [self._serialize(key)
+                                for key in keys[start:start + BATCH_GET_SIZE]]}
+            request.update(self._projection(attributes, select=False))
+            request_items = {table.table_name: request}
+            attempt = 0
+            while request_items:
+                if attempt:
+                    sleep(min(0.05 * 2 ** attempt, 5))
+                response = self.client.batch_get_item(
+                    RequestItems=request_items)
+                items.extend(
+                    self._deserialize(item) for item in
+                    response['Responses'].get(table.table_name, []))
+                request_items = response.get('UnprocessedKeys')
+                attempt += 1
+        return items
+
+    def scan(self, table, limit=None, attributes=None, **filters):
+        kwargs = {'TableName': table.table_name}
+        if filters:
+            kwargs['ScanFilter'] = self._conditions(filters)
+        kwargs.update(self._projection(attributes))
+        return self._paginate(self.client.scan, kwargs, limit)
+
+    def ping(self):
+        self.client.list_tables(Limit=1)
+
+    def _paginate(self, operation, kwargs, limit):
+        """ Yield the items of every page of a query or scan """
+        returned = 0
+        while True:
+            if limit is not None:
+                kwargs['Limit'] = limit - returned
+            response = operation(**kwargs)
+            for item in response.get('Items', []):
+                yield self._deserialize(item)
+            returned += len(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response or \
+                    (limit is not None and returned >= limit):
+                return
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def _conditions(self, filters):
+        conditions = {}
+        for key, value in filters.items():
+            attribute, operation = split_filter(key)
+            values = value if operation == 'between' else [value]
+            conditions[attribute] = {
+                'AttributeValueList': [
+                    self._serializer.serialize(_to_dynamo(v))
+                    for v in values],
+                'ComparisonOperator': _OPERATORS[operation],
+            }
+        return conditions
+
+    @staticmethod
+    def _projection(attributes, select=True):
+        if not attributes:
+            return {}
+        projection = {'AttributesToGet': list(attributes)}
+        if select:
+            projection['Select'] = 'SPECIFIC_ATTRIBUTES'
+        return projection
+
+    @staticmethod
+    def _table_ref(description):
+        key_schema = sorted(description['KeySchema'],
+                            key=lambda key: key['KeyType'] != 'HASH')
+        return TableRef(description['TableName'],
+                        tuple(key['AttributeName'] for key in key_schema))
+
+    def _serialize(self, item):
+        return {key: self._serializer.serialize(_to_dynamo(value))
+                for key, value in item.items()}
+
+    def _deserialize(self, item):
+        return {key: self._deserializer.deserialize(value)
+                for key, value in item.items()}
+
+
+def _to_dynamo(value):
+    """ Convert floats, which boto3 refuses, to Decimals
+
+    Floats are converted exactly, so like boto 2 the serializer rejects
+    ones DynamoDB can't store without rounding, e.g. 3.14 raises
+    `decimal.Inexact`. Pass a Decimal or string to store those.
+    """
+    if isinstance(value, float):
+        return Decimal(value)
+    if isinstance(value, dict):
+        return {key: _to_dynamo(val) for key, val in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_dynamo(val) for val in value]
+    return value
@@ -0,0 +1,120 @@
+class TableNotFound(Exception):
+    """ Raised by a backend when a table does not exist """
+    pass
+
+
+FILTER_OPERATIONS = ('eq', 'lt', 'lte', 'gt', 'gte', 'between', 'beginswith')
+
+
+def split_filter(filter_key):
+    """ Split a filter key into its attribute name and operation
+
+    Params:
+        filter_key (str): Example 'id__eq'
+
+    Returns:
+        (attribute, operation) (tuple): Example ('id', 'eq')
+
+    Raises:
+        ValueError: When the filter operation is not supported
+    """
+    attribute, _, operation = filter_key.rpartition('__')
+    if not attribute or operation not in FILTER_OPERATIONS:
+        raise ValueError(
+            "Unsupported filter {}, must be of the format "
+            "<fieldname>__<filter_operation>".format(filter_key))
+    return attribute, operation
+
+
+class DynamoDBBackend(object):
+    """ The storage operations the DynamoDB blocks are built on.
+
+    Table references returned by a backend are opaque to the blocks except
+    for their `table_name` attribute, and are only ever passed back to the
+    backend that returned them.
+
+    Queries and scans take filters in the `<fieldname>__<filter_operation>`
+    format of the blocks' query filters, and return dict-like items.
+    """
+
+    def get_table(self, table_name):
+        """ Get a reference to an existing table
+
+        Raises:
+            TableNotFound: When the table does not exist
+        """
+        raise NotImplementedError()
+
+    def create_table(self, table_name, hash_key, range_key=None):
+        """ Start creating a table and return a reference to it
+
+        The table may not be usable until `table_status` returns ACTIVE.
+        """
+        raise NotImplementedError()
+
+    def table_status(self, table):
+        """ Return the status of a table, e.g. CREATING or ACTIVE """
+        raise NotImplementedError()
+
+    def key_schema(self, table):
+        """ Return the names of a table's key attributes, hash key first """
+        raise NotImplementedError()
+
+    def batch_write(self, table, items):
+        """ Put a list of items (dicts) into a table """
+        raise NotImplementedError()
+
+    def stored_item(self, table, item):
+        """ Return an item (dict) as reads will return it once it is put
+
+        Values come back in the types the backend decodes them to, and
+        values the backend does not store are left out.
+        """
+        raise NotImplementedError()
+
+    def query(self, table, query_dict):
+        """ Query a table
+
+        Params:
+            query_dict (dict): Filters along with the optional `limit`,
+                `reverse` and `attributes` arguments.
+                Example {'id__eq': 1, 'limit': 1}
+
+        Returns:
+            items (iterable): The matching items
+        """
+        raise NotImplementedError()
+
+    def get_item(self, table, key_attrs, attributes=None, consistent=False):
+        """ Get a single item by primary key
+
+        Params:
+            consistent (bool): Make a strongly consistent read
+
+        Returns:
+            item: The item, or None if it does not exist
+        """
+        raise NotImplementedError()
+
+    def batch_get(self, table, keys, attributes=None):
+        """ Get many items by primary key
+
+        Params:
+            keys (list): Dicts of key attributes, e.g. [{'id': 1}]
+
+        Returns:
+            items (list): The items that exist, in no particular order
+        """
+        raise NotImplementedError()
+
+    def scan(self, table, limit=None, attributes=None, **filters):
+        """ Scan a whole table, optionally filtering its items
+
+        Returns:
+            items (iterable): The matching items
+        """
+        raise NotImplementedError()
+
+    def ping(self):
+        """ Make the cheapest possible request, to measure round trips """
+        raise NotImplementedError()
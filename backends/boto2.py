@@ -0,0 +1,72 @@
+from boto.dynamodb2.exceptions import ItemNotFound
+from boto.dynamodb2.fields import HashKey, RangeKey
+from boto.dynamodb2.items import Item
+from boto.dynamodb2.table import Table
+from boto.exception import JSONResponseError
+
+from .base import DynamoDBBackend, TableNotFound
+
+
+class Boto2Backend(DynamoDBBackend):
+    """ A backend on a boto 2 DynamoDB connection.
+
+    Table references are `boto.dynamodb2.table.Table` objects.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def get_table(self, table_name):
+        table = Table(table_name, connection=self.connection)
+        try:
+            # Counting describes the table, which also loads its schema
+            table.count()
+        except JSONResponseError as jre:
+            if 'ResourceNotFoundException' in str(jre):
+                raise TableNotFound(table_name) from jre
+            raise
+        return table
+
+    def create_table(self, table_name, hash_key, range_key=None):
+        schema = [HashKey(hash_key)]
+        if range_key:
+            schema.append(RangeKey(range_key))
+        return Table.create(
+            table_name,
+            schema=schema,
+            connection=self.connection)
+
+    def table_status(self, table):
+        return table.describe().get('Table', {}).get('TableStatus')
+
+    def key_schema(self, table):
+        return [field.name for field in table.schema or []]
+
+    def batch_write(self, table, items):
+        with table.batch_write() as batch:
+            for item in items:
+                batch.put_item(data=item)
+
+    def stored_item(self, table, item):
+        # Encode the item the way a batch put does, then decode it
+        return {key: table._dynamizer.decode(value) for key, value in
+                Item(table, data=item).prepare_full().items()}
+
+    def query(self, table, query_dict):
+        return table.query_2(**query_dict)
+
+    def get_item(self, table, key_attrs, attributes=None, consistent=False):
+        try:
+            return table.get_item(
+                consistent=consistent, attributes=attributes, **key_attrs)
+        except ItemNotFound:
+            return None
+
+    def batch_get(self, table, keys, attributes=None):
+        return list(table.batch_get(keys=keys, attributes=attributes))
+
+    def scan(self, table, limit=None, attributes=None, **filters):
+        return table.scan(limit=limit, attributes=attributes, **filters)
+
+    def ping(self):
+        self.connection.list_tables(limit=1)
@@ -0,0 +1,134 @@
+import operator
+from copy import deepcopy
+from threading import Lock
+
+from .base import DynamoDBBackend, TableNotFound, split_filter
+
+
+_COMPARISONS = {
+    'eq': operator.eq,
+    'lt': operator.lt,
+    'lte': operator.le,
+    'gt': operator.gt,
+    'gte': operator.ge,
+    'between': lambda value, bounds: bounds[0] <= value <= bounds[1],
+    'beginswith': lambda value, prefix:
+        isinstance(value, str) and value.startswith(prefix),
+}
+
+
+def _matches(value, operation, operand):
+    """ Compare like DynamoDB, where values of another type never match """
+    try:
+        return _COMPARISONS[operation](value, operand)
+    except TypeError:
+        return False
+
+
+class MemoryTable(object):
+    """ A table held in memory, with its items keyed by primary key """
+
+    def __init__(self, table_name, hash_key, range_key=None):
+        self.table_name = table_name
+        self.hash_key = hash_key
+        self.range_key = range_key
+        self.items = {}
+        self.lock = Lock()
+
+    def key(self, item):
+        """ Return the primary key tuple of an item (or key dict) """
+        if self.range_key:
+            return (item[self.hash_key], item[self.range_key])
+        return (item[self.hash_key],)
+
+
+_tables = {}
+_tables_lock = Lock()
+
+
+class MemoryBackend(DynamoDBBackend):
+    """ A backend that keeps tables in memory, for tests and benchmarks.
+
+    By default tables are shared by every memory backend in the process
+    that is in the same region, so blocks can read what other blocks wrote.
+    Items are deep copied when written and read, like a real store.
+    """
+
+    def __init__(self, region_name='local', tables=None):
+        self.region_name = region_name
+        self._tables = _tables if tables is None else tables
+
+    def get_table(self, table_name):
+        with _tables_lock:
+            table = self._tables.get((self.region_name, table_name))
+        if table is None:
+            raise TableNotFound(table_name)
+        return table
+
+    def create_table(self, table_name, hash_key, range_key=None):
+        with _tables_lock:
+            return self._tables.setdefault(
+                (self.region_name, table_name),
+                MemoryTable(table_name, hash_key, range_key))
+
+    def table_status(self, table):
+        return 'ACTIVE'
+
+    def key_schema(self, table):
+        return [key for key in (table.hash_key, table.range_key) if key]
+
+    def batch_write(self, table, items):
+        with table.lock:
+            for item in items:
+                table.items[table.key(item)] = deepcopy(item)
+
+    def stored_item(self, table, item):
+        return deepcopy(item)
+
+    def query(self, table, query_dict):
+        query_dict = dict(query_dict)
+        limit = query_dict.pop('limit', None)
+        reverse = query_dict.pop('reverse', False)
+        attributes = query_dict.pop('attributes', None)
+        items = self._filter(table, query_dict)
+        if table.range_key:
+            items.sort(key=lambda item: item[table.range_key],
+                       reverse=reverse)
+        return self._project(items[:limit], attributes)
+
+    def get_item(self, table, key_attrs, attributes=None, consistent=False):
+        with table.lock:
+            item = table.items.get(table.key(key_attrs))
+        if item is None:
+            return None
+        return self._project([item], attributes)[0]
+
+    def batch_get(self, table, keys, attributes=None):
+        with table.lock:
+            items = [table.items[table.key(key)] for key in keys
+                     if table.key(key) in table.items]
+        return self._project(items, attributes)
+
+    def scan(self, table, limit=None, attributes=None, **filters):
+        return self._project(self._filter(table, filters)[:limit], attributes)
+
+    def ping(self):
+        pass
+
+    @staticmethod
+    def _filter(table, filters):
+        conditions = [split_filter(key) + (value,)
+                      for key, value in filters.items()]
+        with table.lock:
+            return [item for item in table.items.values() if all(
+                attribute in item and
+                _matches(item[attribute], operation, value)
+                for attribute, operation, value in conditions)]
+
+    @staticmethod
+    def _project(items, attributes):
+        if not attributes:
+            return [deepcopy(item) for item in items]
+        return [{attribute: deepcopy(item[attribute])
+                 for attribute in attributes if attribute in item}
+                for item in items]
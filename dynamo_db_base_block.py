@@ -2,15 +2,28 @@ import re
 from enum import Enum
 from collections import defaultdict
 from threading import Lock
+from time import monotonic
+from urllib.parse import urlparse
 
 from nio.block.base import Base
+from nio.command import command
+from nio.command.params.float import FloatParameter
+from nio.command.params.int import IntParameter
 from nio.properties import (Property, PropertyHolder, ObjectProperty,
-                            StringProperty, SelectProperty)
+                            StringProperty, SelectProperty, BoolProperty,
+                            IntProperty, FloatProperty)
 from nio.util.discovery import not_discoverable
+from nio.util.threading import spawn
 
-from boto.exception import JSONResponseError
+from boto.connection import ConnectionPool
+from boto.regioninfo import RegionInfo
 from boto.dynamodb2 import connect_to_region
-from boto.dynamodb2.table import Table
+from boto.dynamodb2.layer1 import DynamoDBConnection
+
+from .backends import Boto2Backend, MemoryBackend, TableNotFound
+from .ingress_queue import IngressOptions, IngressQueue
+from .item_cache import ItemCacheOptions, get_item_cache
+from .profiler import NULL_SPAN, StageProfiler
 
 
 class AWSRegion(Enum):
@@ -19,6 +32,18 @@ class AWSRegion(Enum):
     eu_west_1 = 2
 
 
+class Backend(Enum):
+    boto = 0
+    aws_client = 1
+    memory = 2
+
+
+class RetryMode(Enum):
+    legacy = 0
+    standard = 1
+    adaptive = 2
+
+
 class AWSCreds(PropertyHolder):
     access_key = StringProperty(title="Access Key",
                                 default="[[AMAZON_ACCESS_KEY_ID]]")
@@ -26,6 +51,47 @@ class AWSCreds(PropertyHolder):
                                    default="[[AMAZON_SECRET_ACCESS_KEY]]")
 
 
+class ConnectionOptions(PropertyHolder):
+    region_name = StringProperty(title="Region Name", default="")
+    endpoint = StringProperty(title="Endpoint", default="")
+    port = IntProperty(title="Port", default=None, allow_none=True)
+    is_secure = BoolProperty(title="Use TLS", default=True)
+    timeout = FloatProperty(title="Timeout (seconds)", default=None,
+                            allow_none=True)
+    pool_size = IntProperty(title="Pool Size", default=None, allow_none=True)
+    retry_mode = SelectProperty(RetryMode, title="Retry Mode",
+                                default=RetryMode.adaptive)
+    max_attempts = IntProperty(title="Max Attempts", default=None,
+                               allow_none=True)
+
+
+class BoundedConnectionPool(ConnectionPool):
+    """ A boto connection pool that keeps a limited number of idle
+    connections per host.
+
+    Connections returned to a full pool are closed instead of kept.
+    """
+
+    def __init__(self, max_size):
+        super().__init__()
+        self.max_size = max_size
+
+    def put_http_connection(self, host, port, is_secure, conn):
+        with self.mutex:
+            pool = self.host_to_pool.get((host, port, is_secure))
+            full = pool is not None and pool.size() >= self.max_size
+        if full:
+            conn.close()
+        else:
+            super().put_http_connection(host, port, is_secure, conn)
+
+
+@command('stop_profile')
+@command('profile',
+         FloatParameter('sample_rate', default=1.0),
+         IntParameter('cprofile_calls', default=0))
+@command('ingress_stats')
+@command('cache_stats')
 @not_discoverable
 class DynamoDBBase(Base):
 
@@ -33,26 +99,258 @@ class DynamoDBBase(Base):
     region = SelectProperty(
         AWSRegion, default=AWSRegion.us_east_1, title="AWS Region")
     creds = ObjectProperty(AWSCreds, title="AWS Credentials")
+    backend = SelectProperty(Backend, default=Backend.boto, title="Backend",
+                             advanced=True)
+    connection = ObjectProperty(ConnectionOptions, title="Connection",
+                                default=ConnectionOptions(), advanced=True)
+    item_cache = ObjectProperty(ItemCacheOptions, title="Item Cache",
+                                default=ItemCacheOptions(), advanced=True)
+    ingress = ObjectProperty(IngressOptions, title="Ingress Queue",
+                             default=IngressOptions(), advanced=True)
 
     def __init__(self):
         super().__init__()
-        self._conn = None
+        self._backend = None
+        self._region_name = None
         self._table_cache = {}
+        self._key_schemas = {}
         self._table_locks = defaultdict(Lock)
+        self._item_cache = None
+        self._cache_location = None
+        self._ingress = None
+        self._ingress_workers = []
+        self._profiler = None
 
     def configure(self, context):
         super().configure(context)
-        region_name = re.sub('_', '-', self.region().name)
-        self.logger.debug("Connecting to region {}...".format(region_name))
-        self._conn = connect_to_region(
-            region_name,
-            aws_access_key_id=self.creds().access_key(),
-            aws_secret_access_key=self.creds().access_secret())
+        self._region_name = self.connection().region_name() or \
+            re.sub('_', '-', self.region().name)
+        self.logger.debug(
+            "Connecting to region {}...".format(self._region_name))
+        self._backend = self._create_backend(self._region_name)
         self.logger.debug("Connection complete")
+        if self.item_cache().enabled():
+            self._item_cache = get_item_cache(
+                self.item_cache().name(), self.item_cache().max_items())
+            self._cache_location = (
+                self.backend().name, self._region_name,
+                self.connection().endpoint(), self.connection().port())
+            self.logger.debug("Using item cache {}".format(
+                self.item_cache().name()))
+        if self.ingress().queue_size() > 0:
+            self._ingress = IngressQueue(
+                self.ingress().queue_size(),
+                self.ingress().overflow(),
+                self.ingress().spill_dir())
+
+    def start(self):
+        super().start()
+        if self._ingress is not None:
+            self._ingress_workers = [
+                spawn(self._ingress_worker)
+                for _ in range(max(self.ingress().workers(), 1))]
+
+    def stop(self):
+        if self._ingress is not None:
+            # Give the workers a chance to process what is already queued
+            drain_timeout = self.ingress().drain_timeout() or 0
+            deadline = monotonic() + drain_timeout
+            discarded = self._ingress.close(drain_timeout)
+            if discarded:
+                self.logger.warning(
+                    "Discarded {} pending signal lists".format(discarded))
+            for worker in self._ingress_workers:
+                worker.join(max(deadline - monotonic(), 0))
+            self._ingress_workers = []
+        super().stop()
+
+    def _create_backend(self, region_name, use_endpoint=True):
+        """ Create the configured storage backend for a region
+
+        Args:
+            region_name (str): The region to connect to
+            use_endpoint (bool): Whether or not the configured endpoint
+                applies to this backend
+
+        Returns:
+            backend (backends.DynamoDBBackend): A backend
+        """
+        if self.backend() is Backend.memory:
+            return MemoryBackend(region_name)
+        if self.backend() is Backend.aws_client:
+            # boto3 is only needed when this backend is used
+            from .backends.aws_client import AWSClientBackend
+            options = self.connection()
+            endpoint_url = None
+            if use_endpoint and options.endpoint():
+                host, port, is_secure = self._parse_endpoint(
+                    options.endpoint(), options.port(), options.is_secure())
+                endpoint_url = '{}://{}{}'.format(
+                    'https' if is_secure else 'http', host,
+                    ':{}'.format(port) if port else '')
+            return AWSClientBackend(
+                region_name,
+                aws_access_key_id=self.creds().access_key(),
+                aws_secret_access_key=self.creds().access_secret(),
+                endpoint_url=endpoint_url,
+                timeout=options.timeout(),
+                pool_size=options.pool_size(),
+                retry_mode=options.retry_mode().name,
+                max_attempts=options.max_attempts())
+        return Boto2Backend(self._connect(region_name, use_endpoint))
+
+    def _connect(self, region_name, use_endpoint=True):
+        """ Connect to DynamoDB in a region using the connection options
+
+        Regions that boto doesn't know about are connected to at their
+        standard AWS endpoint, unless an endpoint is configured.
+
+        Args:
+            region_name (str): The region to connect to
+            use_endpoint (bool): Whether or not the configured endpoint
+                applies to this connection
+
+        Returns:
+            conn (boto.dynamodb2.layer1.DynamoDBConnection): A connection
+        """
+        options = self.connection()
+        kwargs = {
+            'aws_access_key_id': self.creds().access_key(),
+            'aws_secret_access_key': self.creds().access_secret(),
+        }
+        if use_endpoint and options.endpoint():
+            host, port, is_secure = self._parse_endpoint(
+                options.endpoint(), options.port(), options.is_secure())
+            kwargs.update(host=host, port=port, is_secure=is_secure)
+            self.logger.debug("Using endpoint {}:{}".format(host, port))
+        conn = connect_to_region(region_name, **kwargs)
+        if conn is None:
+            region = RegionInfo(
+                name=region_name,
+                endpoint='dynamodb.{}.amazonaws.com'.format(region_name),
+                connection_cls=DynamoDBConnection)
+            conn = region.connect(**kwargs)
+        if options.timeout() is not None:
+            conn.http_connection_kwargs['timeout'] = options.timeout()
+        if options.pool_size() is not None:
+            conn._pool = BoundedConnectionPool(options.pool_size())
+        return conn
+
+    @staticmethod
+    def _parse_endpoint(endpoint, port, is_secure):
+        """ Split an endpoint into a host, port and whether to use TLS
+
+        The endpoint may be a bare host name or a URL, in which case its
+        scheme and port take precedence.
+
+        Returns:
+            (host, port, is_secure) (tuple)
+        """
+        if '://' not in endpoint:
+            return endpoint, port, is_secure
+        url = urlparse(endpoint)
+        return url.hostname, url.port or port, url.scheme == 'https'
+
+    def cache_stats(self):
+        """ Command to return the shared item cache counters """
+        if self._item_cache is None:
+            return {}
+        return self._item_cache.stats()
+
+    def _get_cache_key(self, table_name, key_attrs):
+        """ Build the item cache key of an item in a table
+
+        Args:
+            table_name (str): The name of the table
+            key_attrs (dict): The item's primary key, e.g. {'id': 1}
+
+        Returns:
+            key (tuple): The cache key, or None if there is no item cache,
+                the table's key schema is unknown, the attributes are not
+                exactly its key, or a key value can't be cached
+        """
+        if self._item_cache is None:
+            return None
+        key_schema = self._key_schemas.get(table_name)
+        if not key_schema or set(key_attrs) != set(key_schema):
+            return None
+        return self._item_cache.make_key(
+            self._cache_location, table_name, key_attrs)
+
+    def ingress_stats(self):
+        """ Command to return the ingress queue depth and wait times """
+        if self._ingress is None:
+            return {}
+        return self._ingress.stats()
+
+    def profile(self, sample_rate=1.0, cprofile_calls=0):
+        """ Command to time the stages of a sample of signal lists
+
+        Starts profiling if it is off, otherwise changes the sample rate.
+        When `cprofile_calls` is set, a cProfile of that many of the next
+        signal lists is captured too.
+
+        Returns:
+            stats (dict): The stage timings gathered so far
+        """
+        profiler = self._profiler or StageProfiler()
+        profiler.sample_rate = min(max(float(sample_rate), 0.0), 1.0)
+        if int(cprofile_calls) > 0:
+            profiler.capture(int(cprofile_calls))
+        self._profiler = profiler
+        return profiler.stats()
+
+    def stop_profile(self):
+        """ Command to stop profiling and return the final stage timings """
+        profiler, self._profiler = self._profiler, None
+        if profiler is None:
+            return {}
+        return profiler.stats()
+
+    def _span(self, stage):
+        """ Return a context manager timing a stage when profiling """
+        if self._profiler is None:
+            return NULL_SPAN
+        return self._profiler.span(stage)
+
+    def _is_sampling(self):
+        """ Return whether the signals being processed are profiled """
+        return self._profiler is not None and self._profiler.is_sampling()
 
     def process_signals(self, signals, input_id='default'):
+        if self._ingress is None:
+            self._process_signals(signals)
+        elif not self._ingress.put(signals):
+            self.logger.warning(
+                "Ingress queue did not accept {} signals".format(len(signals)))
+
+    def _ingress_worker(self):
+        """ Process signal lists from the ingress queue until it closes """
+        while True:
+            signals = self._ingress.get()
+            if signals is None:
+                return
+            try:
+                self._process_signals(signals)
+            except:
+                self.logger.exception("Failed to process queued signals")
+
+    def _process_signals(self, signals):
+        """ Operate on signals, grouped by table, and notify any output """
+        profiler = self._profiler
+        if profiler is None:
+            self._operate_on_signals(signals)
+            return
+        profiler.begin()
+        try:
+            self._operate_on_signals(signals)
+        finally:
+            profiler.end()
+
+    def _operate_on_signals(self, signals):
         output = []
-        table_signals = self._get_table_signals(signals)
+        with self._span('grouping'):
+            table_signals = self._get_table_signals(signals)
         for table_name, sigs in table_signals.items():
             self.logger.debug("Operating on {} signals to table {}".format(
                 len(sigs), table_name))
@@ -63,7 +361,8 @@ class DynamoDBBase(Base):
                 self.logger.exception("Could not batch operate on table {}"
                                       .format(table_name))
         if output:
-            self.notify_signals(output)
+            with self._span('notify'):
+                self.notify_signals(output)
 
     def execute_signals_query(self, table, signals):
         """ Run this block's query on the provided table.
@@ -75,7 +374,7 @@ class DynamoDBBase(Base):
         notified.
 
         Params:
-            table (boto.dynamodb2.table.Table): A valid table
+            table: A valid table reference from the block's backend
             signals (list(Signal)): The signals which triggered the query
 
         Returns:
@@ -118,11 +417,17 @@ class DynamoDBBase(Base):
         # Lock around each table - in case it is creating still
         self.logger.debug(
             "Waiting for table lock on {}".format(table_name))
-        with self._table_locks[table_name]:
+        lock = self._table_locks[table_name]
+        with self._span('lock_wait'):
+            lock.acquire()
+        try:
             self.logger.debug(
                 "Table lock acquired for {}".format(table_name))
-            table = self._get_table(table_name)
+            with self._span('table_lookup'):
+                table = self._get_table(table_name)
             output = self.execute_signals_query(table, signals)
+        finally:
+            lock.release()
         if not isinstance(output, list):
             output = []
         return output
@@ -132,7 +437,8 @@ class DynamoDBBase(Base):
 
         If we have looked up/created this table before, use the cached
         reference. If not, check to make sure the table exists. If it does
-        not exist, create it and return that reference.
+        not exist, create it and return that reference. The names of the
+        table's key attributes are cached in `_key_schemas`, hash key first.
 
         Note that if this function does not find the table, it will create it
         and this creation operation can block for some time (typically ~10s).
@@ -147,38 +453,35 @@ class DynamoDBBase(Base):
             create (bool): If table does not exist, create it.
 
         Returns:
-            table: A boto table reference
+            table: A table reference from the block's backend
 
         Raises:
-            Exception: When table does not exist and `create` is False.
+            TableNotFound: When table does not exist and `create` is False.
         """
         if table_name in self._table_cache:
             return self._table_cache[table_name]
 
-        table = Table(table_name, connection=self._conn)
-
         try:
-            num_items = table.count()
-            self.logger.debug("Table {} found - contains {} items".format(
-                table_name, num_items))
-        except JSONResponseError as jre:
-            if create and 'ResourceNotFoundException' in str(jre):
-                # If we get a resource not found exception, the table must not
-                # exist, so let's create it
-                self.logger.info("Table {} not found - creating it".format(
-                    table_name))
-                table = self._create_table(table_name)
-                self.logger.debug("Table created: {}".format(table))
-            else:
-                # We got some other type of exception, raise it since that
-                # wasn't expected
+            table = self._backend.get_table(table_name)
+            self.logger.debug("Table {} found".format(table_name))
+        except TableNotFound:
+            if not create:
                 raise
+            # The table must not exist, so let's create it
+            self.logger.info("Table {} not found - creating it".format(
+                table_name))
+            table = self._create_table(table_name)
+            self.logger.debug("Table created: {}".format(table))
         except:
             self.logger.exception("Unable to determine table reference")
             raise
 
-        # Cache this reference to the table for later use
+        # Cache this reference to the table for later use, along with the
+        # key schema loaded when the table was found (or created)
         self._table_cache[table_name] = table
+        key_schema = self._backend.key_schema(table)
+        if key_schema:
+            self._key_schemas[table_name] = key_schema
         return table
 
     def _create_table(self, table_name):
@@ -1,8 +1,5 @@
 from time import sleep
 
-from boto.dynamodb2.fields import HashKey, RangeKey
-from boto.dynamodb2.table import Table
-
 from nio import TerminatorBlock
 from nio.properties import StringProperty, VersionProperty
 
@@ -14,19 +11,34 @@ class DynamoDBInsert(DynamoDBBase, TerminatorBlock):
 
     hash_key = StringProperty(title="Hash Key", default="_id")
     range_key = StringProperty(title="Range Key", default="")
-    version = VersionProperty("1.1.0")
+    version = VersionProperty("1.2.0")
 
     def execute_signals_query(self, table, signals):
         """ Save a list of signals to a table reference """
-        with table.batch_write() as batch:
+        items = []
+        with self._span('serialization'):
             for sig in signals:
-                self._save_signal(batch, sig)
+                data = self._get_signal_item(sig)
+                if data is not None:
+                    items.append(data)
+        try:
+            with self._span('network'):
+                self._backend.batch_write(table, items)
+        except:
+            # We can't tell which items made it, so drop them all
+            self._update_item_cache(table, items, invalidate=True)
+            raise
+        self._update_item_cache(table, items)
 
-    def _save_signal(self, table, signal):
-        """ Save a signal to a DynamoDB table """
+    def _get_signal_item(self, signal):
+        """ Get the item to save for a signal
+
+        Returns:
+            data (dict): The item to put, or None if the signal is invalid
+        """
         try:
             if self._is_valid_signal(signal):
-                table.put_item(data=signal.to_dict())
+                return signal.to_dict()
             else:
                 self.logger.warning(
                     "Not saving an invalid signal - must contain hash and "
@@ -34,6 +46,37 @@ class DynamoDBInsert(DynamoDBBase, TerminatorBlock):
         except:
             self.logger.exception("Unable to save signal")
 
+    def _update_item_cache(self, table, items, invalidate=False):
+        """ Populate (or invalidate) the shared item cache after a write
+
+        Items are cached under the table's own key schema, which may not be
+        the hash and range keys this block is configured with, and in the
+        form reads from the table return them.
+
+        Args:
+            table: The table reference written to
+            items (list): The items that were put
+            invalidate (bool): Drop the items instead of caching them
+        """
+        if self._item_cache is None:
+            return
+        key_schema = self._key_schemas.get(table.table_name, [])
+        for data in items:
+            key = self._get_cache_key(table.table_name, {
+                attr: data[attr] for attr in key_schema if attr in data})
+            if key is None:
+                continue
+            if invalidate:
+                self._item_cache.invalidate(key)
+                continue
+            try:
+                self._item_cache.put(
+                    key, self._backend.stored_item(table, data))
+            except:
+                self.logger.warning(
+                    "Unable to cache item {}".format(data), exc_info=True)
+                self._item_cache.invalidate(key)
+
     def _is_valid_signal(self, signal):
         """ Return true if this signal is valid and can be saved """
         # A signal has a valid hash if it contains the hash field
@@ -53,16 +96,12 @@ class DynamoDBInsert(DynamoDBBase, TerminatorBlock):
             self.logger.info(
                 "Creating table with hash key: {}, range key: {}".format(
                     hash_key, range_key))
-            schema = [HashKey(hash_key), RangeKey(range_key)]
         else:
             self.logger.info(
                 "Creating table with hash key: {}".format(hash_key))
-            schema = [HashKey(hash_key)]
 
-        new_table = Table.create(
-            table_name,
-            schema=schema,
-            connection=self._conn)
+        new_table = self._backend.create_table(
+            table_name, hash_key, range_key)
 
         # Wait for our new table to be created
         status = 'CREATING'
@@ -75,4 +114,4 @@ class DynamoDBInsert(DynamoDBBase, TerminatorBlock):
 
     def _get_table_status(self, table):
         """ Get a table's status from AWS """
-        return table.describe().get('Table', {}).get('TableStatus')
+        return self._backend.table_status(table)
@@ -1,9 +1,17 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from time import monotonic
+
 from nio import Block
 from nio.block.mixins import EnrichSignals
+from nio.command import command
+from nio.modules.scheduler import Job
 from nio.properties import (Property, PropertyHolder, ListProperty,
-                            BoolProperty, VersionProperty)
+                            BoolProperty, ObjectProperty, VersionProperty)
+from nio.types import StringType
+from nio.util.threading import spawn
 
 from .dynamo_db_base_block import DynamoDBBase
+from .replica_router import ReplicaOptions, ReplicaRouter
 
 
 class Limitable():
@@ -32,6 +40,20 @@ class Reversable():
         return existing_args
 
 
+class Projectable():
+    """ A dynamo block mixin that allows you to fetch only some attributes """
+
+    projection = ListProperty(StringType, title='Projection', default=[])
+
+    def _build_query_dict(self, signal=None):
+        existing_args = super()._build_query_dict(signal)
+        projection = self.projection(signal)
+        # Don't send attributes if none are listed (default)
+        if projection:
+            existing_args['attributes'] = projection
+        return existing_args
+
+
 class QueryFilter(PropertyHolder):
 
     key = Property(title='Filter Key',
@@ -42,18 +64,74 @@ class QueryFilter(PropertyHolder):
                      attr_default=Exception)
 
 
-class DynamoDBQuery(EnrichSignals, Limitable, Reversable, DynamoDBBase, Block):
+@command('replica_stats')
+class DynamoDBQuery(EnrichSignals, Limitable, Reversable, Projectable,
+                    DynamoDBBase, Block):
 
     query_filters = ListProperty(QueryFilter,
                                  title='Query Filters',
                                  default=[QueryFilter()])
-    version = VersionProperty("1.1.0")
+    compact_output = BoolProperty(title='Compact Output', default=False,
+                                  advanced=True)
+    replicas = ObjectProperty(ReplicaOptions, title='Replicas',
+                              default=ReplicaOptions(), advanced=True)
+    version = VersionProperty("1.2.0")
+
+    def __init__(self):
+        super().__init__()
+        self._router = None
+        self._replica_backends = {}
+        self._replica_tables = {}
+        self._probe_job = None
+        self._hedge_executor = None
+
+    def configure(self, context):
+        super().configure(context)
+        replica_regions = [replica.region_name()
+                           for replica in self.replicas().regions()]
+        if not replica_regions:
+            return
+        # The home region comes first so it wins until latencies are known
+        self._replica_backends[self._region_name] = self._backend
+        for region_name in replica_regions:
+            if region_name not in self._replica_backends:
+                self.logger.debug(
+                    "Connecting to replica region {}".format(region_name))
+                self._replica_backends[region_name] = self._create_backend(
+                    region_name, use_endpoint=False)
+        self._router = ReplicaRouter(
+            list(self._replica_backends), self.replicas().max_error_rate())
+        if self.replicas().hedge_after() is not None:
+            self._hedge_executor = ThreadPoolExecutor(
+                thread_name_prefix='{}-hedge'.format(self.name()))
+
+    def start(self):
+        super().start()
+        if self._router is not None:
+            spawn(self._probe_replicas)
+            self._probe_job = Job(self._probe_replicas,
+                                  self.replicas().probe_interval(), True)
+
+    def stop(self):
+        # Signals still queued for ingress are drained first, and may need
+        # the replicas to be queried
+        super().stop()
+        if self._probe_job is not None:
+            self._probe_job.cancel()
+        if self._hedge_executor is not None:
+            self._hedge_executor.shutdown(wait=False)
+
+    def replica_stats(self):
+        """ Command to return the latency and error rate of each replica """
+        if self._router is None:
+            return {}
+        return self._router.stats()
 
     def execute_signals_query(self, table, signals):
         """ Overriden from base class
 
         Params:
-            table (boto.dynamodb2.table.Table): A valid table
+            table: A valid table reference from the block's backend
             signals (list(Signal)): The signals which triggered the query
 
         Returns:
@@ -70,11 +148,13 @@ class DynamoDBQuery(EnrichSignals, Limitable, Reversable, DynamoDBBase, Block):
     def _execute_signal_query(self, table, signal):
         """ Execute a query against the table
 
-        This method takes in one signal and returns one signal when query
-        is successful. Raises an exception if the query is not succesful.
+        This method takes in one signal and returns one signal per result
+        when query is successful, or a single signal holding every result
+        when `compact_output` is set. Raises an exception if the query is
+        not succesful.
 
         Params:
-            table (boto.dynamodb2.table.Table): A valid table
+            table: A valid table reference from the block's backend
             signals (list(Signal)): The signals which triggered the query
 
         Returns:
@@ -83,14 +163,238 @@ class DynamoDBQuery(EnrichSignals, Limitable, Reversable, DynamoDBBase, Block):
         Raises:
             Exception: A failed query for any reason will raise an exception
         """
-        output = []
         query_dict = self._build_query_dict(signal)
+        with self._span('network'):
+            results = self._query_items(table, query_dict)
+            if self._is_sampling():
+                # Results may be fetched as they are iterated, so fetch them
+                # here to keep the network time out of serialization
+                results = list(results)
+        with self._span('serialization'):
+            if self.compact_output():
+                return [self._get_compact_signal(results, signal)]
+            return [self.get_output_signal(dict(item), signal)
+                    for item in results]
+
+    def _query_items(self, table, query_dict):
+        """ Return the items matching a query, from the cache if possible
+
+        Returns:
+            items (iterable): dict-like items
+        """
+        item = self._get_cached_item(table, query_dict)
+        if item is not None:
+            self.logger.debug(
+                'Serving query {} from item cache'.format(query_dict))
+            return [item]
         self.logger.debug(
             'Querying table {} with: {}'.format(table, query_dict))
-        results = table.query_2(**query_dict)
-        for item in results:
-            output.append(self.get_output_signal(dict(item), signal))
-        return output
+        if self._router is not None:
+            return self._query_replicas(table, query_dict)
+        return self._run_query(table, query_dict)
+
+    def _run_query(self, table, query_dict, backend=None, fill_cache=True):
+        """ Run a query, using GetItem for a lookup of a single item
+
+        A query is a single item lookup when its filters are equalities on
+        exactly the table's key attributes and it is not limited to more
+        than one result. GetItem has less overhead than a query.
+
+        With `fill_on_read`, items fetched in full from the home region are
+        added to the item cache, unless an insert wrote to the cache while
+        they were read. Those reads are strongly consistent, at twice the
+        read capacity, so the cache is never filled with an item older
+        than the last successful write.
+
+        Params:
+            backend (DynamoDBBackend): The backend the table reference
+                belongs to, if not the block's own
+            fill_cache (bool): Whether the table is in the home region,
+                so items read from it may be added to the item cache
+
+        Returns:
+            items (iterable): dict-like items
+        """
+        backend = backend or self._backend
+        key_attrs = self._get_item_key(table, query_dict)
+        if key_attrs is None:
+            return backend.query(table, query_dict)
+        key = None
+        if fill_cache and self.item_cache().fill_on_read() and \
+                'attributes' not in query_dict:
+            key = self._get_cache_key(table.table_name, key_attrs)
+        if key is not None:
+            generation = self._item_cache.generation()
+        self.logger.debug('Getting item {}'.format(key_attrs))
+        item = backend.get_item(
+            table, key_attrs, attributes=query_dict.get('attributes'),
+            consistent=key is not None)
+        if item is None:
+            return []
+        if key is not None:
+            self._item_cache.fill(key, dict(item), generation)
+        return [item]
+
+    def _get_item_key(self, table, query_dict):
+        """ Return the primary key of a single item lookup
+
+        Returns:
+            key_attrs (dict): Example {'id': 1}, or None if the query is
+                not a single item lookup or the table's schema is unknown
+        """
+        if query_dict.get('limit', 1) != 1:
+            return None
+        key_schema = self._key_schemas.get(table.table_name)
+        key_attrs = self._get_point_key(query_dict)
+        if not key_schema or not key_attrs or \
+                set(key_attrs) != set(key_schema):
+            return None
+        return key_attrs
+
+    def _query_replicas(self, table, query_dict):
+        """ Run a query against the best replica of the table
+
+        If hedging is configured and the best replica hasn't answered
+        within `hedge_after` seconds (or failed), the query is also sent to
+        the next best replica and whichever answers first wins. Otherwise
+        replicas are tried in order until one succeeds.
+
+        Returns:
+            items (list): dict-like items
+        """
+        regions = self._router.ranked()
+        if self._hedge_executor is not None and len(regions) > 1:
+            return self._hedge_query(regions[:2], table, query_dict)
+        for region_name in regions[:-1]:
+            try:
+                return self._query_region(region_name, table, query_dict)
+            except:
+                self.logger.warning(
+                    "Query to replica {} failed, trying the next one".format(
+                        region_name), exc_info=True)
+        return self._query_region(regions[-1], table, query_dict)
+
+    def _hedge_query(self, regions, table, query_dict):
+        """ Query the first region, hedging to the second if it is slow
+
+        The first query runs on the hedge executor too, even though it
+        usually answers before `hedge_after`, so that a slow answer can be
+        given up on. That costs a thread handoff on every query.
+        """
+        first = self._hedge_executor.submit(
+            self._query_region, regions[0], table, query_dict)
+        wait([first], timeout=self.replicas().hedge_after())
+        if first.done() and first.exception() is None:
+            return first.result()
+        self.logger.debug("Hedging query to replica {}".format(regions[1]))
+        futures = [first, self._hedge_executor.submit(
+            self._query_region, regions[1], table, query_dict)]
+        error = None
+        for future in as_completed(futures):
+            try:
+                return future.result()
+            except Exception as e:
+                error = e
+        raise error
+
+    def _query_region(self, region_name, table, query_dict):
+        """ Query a table in one region, recording how long it took
+
+        The whole result set is read so the latency covers every page.
+        """
+        backend = self._replica_backends[region_name]
+        start = monotonic()
+        try:
+            replica_table = self._get_replica_table(region_name, table)
+            items = list(self._run_query(
+                replica_table, query_dict, backend,
+                fill_cache=region_name == self._region_name))
+        except:
+            self._router.record(region_name, error=True)
+            raise
+        self._router.record(region_name, monotonic() - start)
+        return items
+
+    def _get_replica_table(self, region_name, table):
+        """ Get the reference to a table in a replica region """
+        if region_name == self._region_name:
+            return table
+        key = (region_name, table.table_name)
+        if key not in self._replica_tables:
+            self._replica_tables[key] = self._replica_backends[
+                region_name].get_table(table.table_name)
+        return self._replica_tables[key]
+
+    def _probe_replicas(self):
+        """ Measure the round trip to each replica region """
+        for region_name, backend in self._replica_backends.items():
+            start = monotonic()
+            try:
+                backend.ping()
+            except:
+                self.logger.warning("Probe to replica {} failed".format(
+                    region_name), exc_info=True)
+                self._router.record(region_name, error=True)
+            else:
+                self._router.record(region_name, monotonic() - start)
+
+    def _get_compact_signal(self, results, signal):
+        """ Build one signal carrying every result as a list
+
+        The results are stored under `enrich_field`, or `results` if no
+        enrich field is configured.
+        """
+        items = [dict(item) for item in results]
+        # Evaluate the enrich options the way get_output_signal does
+        enrich_field = self.enrich().enrich_field()
+        if enrich_field and \
+                not self.enrich(signal).exclude_existing(signal):
+            return self.get_output_signal(items, signal)
+        return self.get_output_signal(
+            {enrich_field or 'results': items}, signal)
+
+    def _get_cached_item(self, table, query_dict):
+        """ Look up a point read in the shared item cache
+
+        Only queries on exactly the table's key attributes are point reads.
+
+        Returns:
+            item (dict): The cached item, or None if the query is not a
+                point read or the item is not cached
+        """
+        if self._item_cache is None:
+            return None
+        key_attrs = self._get_point_key(query_dict)
+        if not key_attrs:
+            return None
+        key = self._get_cache_key(table.table_name, key_attrs)
+        if key is None:
+            return None
+        item = self._item_cache.get(key)
+        if item is not None and 'attributes' in query_dict:
+            item = {attr: value for attr, value in item.items()
+                    if attr in query_dict['attributes']}
+        return item
+
+    @staticmethod
+    def _get_point_key(query_dict):
+        """ Return the key attributes of a query made only of equalities
+
+        Params:
+            query_dict (dict): Example {'id__eq': 1, 'limit': 1}
+
+        Returns:
+            key_attrs (dict): Example {'id': 1}, or None if any filter is
+                not an equality
+        """
+        key_attrs = {}
+        for key, value in query_dict.items():
+            if key in ('limit', 'reverse', 'attributes'):
+                continue
+            if not key.endswith('__eq'):
+                return None
+            key_attrs[key[:-len('__eq')]] = value
+        return key_attrs
 
     def _build_query_dict(self, signal):
         """ Builds a query dictionary from query_filter property
@@ -0,0 +1,244 @@
+import os
+import pickle
+import shutil
+from collections import deque
+from enum import Enum
+from tempfile import mkdtemp
+from threading import Condition
+from time import monotonic
+
+from nio.properties import PropertyHolder, IntProperty, SelectProperty, \
+    StringProperty, FloatProperty
+
+
+class OverflowPolicy(Enum):
+    block = 0
+    drop_oldest = 1
+    drop_newest = 2
+    spill = 3
+
+
+class IngressOptions(PropertyHolder):
+    queue_size = IntProperty(title="Queue Size", default=0)
+    workers = IntProperty(title="Workers", default=1)
+    overflow = SelectProperty(OverflowPolicy, title="Overflow Policy",
+                              default=OverflowPolicy.block)
+    spill_dir = StringProperty(title="Spill Directory", default="")
+    drain_timeout = FloatProperty(title="Drain Timeout (seconds)",
+                                  default=5)
+
+
+class _SpillFile(object):
+    """ A spilled item's file, which is only read once it is written """
+
+    def __init__(self, path):
+        self.path = path
+        self.written = False
+
+
+class IngressQueue(object):
+    """ A bounded, thread-safe FIFO queue with an overflow policy.
+
+    When the queue is full, `put` either blocks until there is room, drops
+    the oldest item, drops the item being put or spills it to disk. Once
+    items have been spilled, new items are spilled too until the spill is
+    drained, so items always come out in the order they went in.
+
+    Spill files are written and read outside of the queue's lock, so
+    producers and consumers of items in memory don't wait on the disk.
+    Items that can't be pickled or written to disk are dropped.
+    """
+
+    def __init__(self, max_size, policy=OverflowPolicy.block,
+                 spill_dir=None):
+        self.max_size = max_size
+        self.policy = policy
+        self._spill_parent = spill_dir or None
+        self._spill_dir = None
+        self._items = deque()
+        self._spilled = deque()
+        self._spill_count = 0
+        self._unspilling = 0
+        self._closing = False
+        self._closed = False
+        self._cond = Condition()
+        self._stats = dict.fromkeys(
+            ['enqueued', 'dequeued', 'dropped', 'spilled', 'blocked'], 0)
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def put(self, item):
+        """ Add an item to the queue, applying the overflow policy if full
+
+        Returns:
+            accepted (bool): False if the item was dropped
+        """
+        with self._cond:
+            if self._closing:
+                return False
+            if self._spilled or len(self._items) >= self.max_size:
+                if self.policy is OverflowPolicy.drop_newest:
+                    self._stats['dropped'] += 1
+                    return False
+                elif self.policy is OverflowPolicy.drop_oldest:
+                    self._items.popleft()
+                    self._stats['dropped'] += 1
+                elif self.policy is OverflowPolicy.block:
+                    self._stats['blocked'] += 1
+                    while len(self._items) >= self.max_size and \
+                            not self._closing:
+                        self._cond.wait()
+                    if self._closing:
+                        return False
+            if not self._spilled and len(self._items) < self.max_size:
+                self._items.append((monotonic(), item))
+                self._stats['enqueued'] += 1
+                self._cond.notify_all()
+                return True
+        # Only the spill policy gets here, once the queue is full
+        return self._spill((monotonic(), item))
+
+    def get(self, timeout=None):
+        """ Remove and return the oldest item, waiting for one if needed
+
+        Returns:
+            item: The oldest item, or None if the queue was closed or the
+                timeout expired
+        """
+        while True:
+            with self._cond:
+                while not (self._items or self._closed or
+                           (self._spilled and self._spilled[0].written)):
+                    if not self._cond.wait(timeout):
+                        return None
+                if self._items:
+                    return self._dequeued(*self._items.popleft())
+                if self._closed:
+                    return None
+                spill_file = self._spilled.popleft()
+                self._unspilling += 1
+                # Let producers stop spilling while the file is read
+                self._cond.notify_all()
+            entry = self._unspill(spill_file)
+            with self._cond:
+                self._unspilling -= 1
+                if entry is None:
+                    self._stats['dropped'] += 1
+                    self._cond.notify_all()
+                else:
+                    return self._dequeued(*entry)
+
+    def close(self, timeout=0):
+        """ Close the queue, discarding any items still pending
+
+        New items are refused and blocked producers are released straight
+        away, then consumers are given up to `timeout` seconds to drain the
+        queue before the rest is discarded and waiting consumers released.
+
+        Returns:
+            discarded (int): The number of items that were still pending
+        """
+        deadline = monotonic() + (timeout or 0)
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+            while self._items or self._spilled or self._unspilling:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            self._closed = True
+            discarded = len(self._items) + len(self._spilled)
+            self._items.clear()
+            self._spilled.clear()
+            spill_dir = self._spill_dir
+            self._cond.notify_all()
+        if spill_dir:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+        return discarded
+
+    def stats(self):
+        """ Return the queue depth, counters and wait times in seconds """
+        with self._cond:
+            stats = dict(self._stats)
+            stats['depth'] = len(self._items) + len(self._spilled)
+            stats['spill_depth'] = len(self._spilled)
+            stats['max_wait'] = self._wait_max
+            stats['avg_wait'] = self._wait_total / self._stats['dequeued'] \
+                if self._stats['dequeued'] else 0.0
+            return stats
+
+    def _dequeued(self, enqueued_at, item):
+        """ Record the wait time of an item leaving the queue """
+        wait_time = monotonic() - enqueued_at
+        self._stats['dequeued'] += 1
+        self._wait_total += wait_time
+        self._wait_max = max(self._wait_max, wait_time)
+        self._cond.notify_all()
+        return item
+
+    def _spill(self, entry):
+        """ Write an entry to a spill file at the back of the queue
+
+        Returns:
+            accepted (bool): False if the entry could not be spilled
+        """
+        try:
+            data = pickle.dumps(entry)
+        except Exception:
+            with self._cond:
+                self._stats['dropped'] += 1
+            return False
+        with self._cond:
+            if self._closing:
+                return False
+            try:
+                if not self._spill_dir:
+                    self._spill_dir = mkdtemp(
+                        prefix='dynamo_db_ingress_', dir=self._spill_parent)
+            except OSError:
+                self._stats['dropped'] += 1
+                return False
+            spill_file = _SpillFile(os.path.join(
+                self._spill_dir, '{:012d}.pickle'.format(self._spill_count)))
+            self._spill_count += 1
+            # Hold the item's place in the queue while it is written
+            self._spilled.append(spill_file)
+        try:
+            with open(spill_file.path, 'wb') as f:
+                f.write(data)
+        except OSError:
+            self._remove(spill_file.path)
+            with self._cond:
+                if spill_file in self._spilled:
+                    self._spilled.remove(spill_file)
+                self._stats['dropped'] += 1
+                self._cond.notify_all()
+            return False
+        with self._cond:
+            spill_file.written = True
+            self._stats['enqueued'] += 1
+            self._stats['spilled'] += 1
+            self._cond.notify_all()
+        return True
+
+    def _unspill(self, spill_file):
+        """ Read an entry back from its spill file
+
+        Returns:
+            entry (tuple): The entry, or None if it could not be read
+        """
+        try:
+            with open(spill_file.path, 'rb') as f:
+                return pickle.load(f)
+        except Exception:
+            return None
+        finally:
+            self._remove(spill_file.path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
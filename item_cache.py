@@ -0,0 +1,149 @@
+from collections import OrderedDict
+from copy import deepcopy
+from threading import Lock
+
+from nio.properties import PropertyHolder, BoolProperty, StringProperty, \
+    IntProperty
+
+
+class ItemCacheOptions(PropertyHolder):
+    enabled = BoolProperty(title="Enabled", default=False)
+    name = StringProperty(title="Cache Name", default="default")
+    max_items = IntProperty(title="Max Items", default=10000)
+    fill_on_read = BoolProperty(title="Fill On Read", default=False)
+
+
+class ItemCache(object):
+    """ A thread-safe, bounded LRU cache of DynamoDB items.
+
+    Items are keyed by where their table lives, the table name and the
+    primary key. The primary key is the dictionary of key attribute names to
+    values, so a cache entry written with `{'id': 1}` can only be read back
+    by a lookup on exactly `id`.
+
+    Writes `put` (or `invalidate`) items, while reads only `fill` items
+    that are missing, and only if nothing was written to the cache since
+    the read started, so a slow read can never replace a newer write.
+
+    Counters are kept for hits, misses, puts, fills, invalidations and
+    evictions so that the consistency of the cache can be monitored.
+    """
+
+    def __init__(self, max_items=10000):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = Lock()
+        self._generation = 0
+        self._stats = dict.fromkeys(
+            ['hits', 'misses', 'puts', 'fills', 'invalidations',
+             'evictions'], 0)
+
+    @staticmethod
+    def make_key(location, table_name, key_attrs):
+        """ Build a cache key from a table name and primary key attributes
+
+        Args:
+            location (tuple): Where the table lives, e.g. its backend,
+                region and endpoint, so that tables of the same name in
+                different places don't share items
+            table_name (str): The name of the table
+            key_attrs (dict): The item's primary key, e.g. {'id': 1}
+
+        Returns:
+            key (tuple): A hashable key, or None if a key value is not
+                hashable (lists, dicts...) and the item cannot be cached
+        """
+        try:
+            key = (location, table_name, frozenset(key_attrs.items()))
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def get(self, key):
+        """ Return a copy of the cached item for key, or None on a miss """
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self._stats['misses'] += 1
+                return None
+            self._items.move_to_end(key)
+            self._stats['hits'] += 1
+            return deepcopy(item)
+
+    def put(self, key, item):
+        """ Store a copy of a written item under key """
+        with self._lock:
+            self._generation += 1
+            self._store(key, item)
+            self._stats['puts'] += 1
+
+    def generation(self):
+        """ Return the write generation, to pass to `fill` after a read """
+        with self._lock:
+            return self._generation
+
+    def fill(self, key, item, generation):
+        """ Store a copy of an item read from the table under key
+
+        Args:
+            generation (int): The `generation` from before the read started
+
+        Returns:
+            filled (bool): False if the key is already cached or the cache
+                was written to since the read started
+        """
+        with self._lock:
+            if key in self._items or generation != self._generation:
+                return False
+            self._store(key, item)
+            self._stats['fills'] += 1
+            return True
+
+    def invalidate(self, key):
+        """ Drop the cached item for key, if any """
+        with self._lock:
+            self._generation += 1
+            if self._items.pop(key, None) is not None:
+                self._stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def _store(self, key, item):
+        """ Store a deep copy of item under key, evicting the oldest if full
+
+        Items are copied on the way in and out so that nested lists and
+        maps are never shared with the signals the cache serves.
+        """
+        self._items[key] = deepcopy(item)
+        self._items.move_to_end(key)
+        while len(self._items) > max(self.max_items, 0):
+            self._items.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def stats(self):
+        """ Return the cache counters along with its current size """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._items)
+            stats['max_items'] = self.max_items
+            return stats
+
+
+_caches = {}
+_caches_lock = Lock()
+
+
+def get_item_cache(name, max_items):
+    """ Get the process-wide cache with the given name, creating it if needed
+
+    Blocks configured with the same cache name share one cache, which is how
+    a DynamoDBInsert makes its writes visible to a DynamoDBQuery. The first
+    block to create a cache determines its size.
+    """
+    with _caches_lock:
+        if name not in _caches:
+            _caches[name] = ItemCache(max_items)
+        return _caches[name]
@@ -0,0 +1,139 @@
+import cProfile
+import io
+import pstats
+from random import random
+from threading import Lock, local
+from time import monotonic
+
+
+class _NullSpan(object):
+    """ A span that does nothing, for calls that are not sampled """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Span(object):
+
+    def __init__(self, profiler, stage):
+        self._profiler = profiler
+        self._stage = stage
+        self._start = None
+
+    def __enter__(self):
+        self._start = monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._profiler.record(self._stage, monotonic() - self._start)
+        return False
+
+
+class StageProfiler(object):
+    """ Times the stages of a sample of calls, and optionally captures a
+    cProfile of the next few calls.
+
+    A call is wrapped in `begin` and `end`, which decide whether the call
+    is sampled. Stages of a sampled call are timed with `span`. Sampling is
+    tracked per thread, so concurrent calls don't mix up their spans.
+    """
+
+    def __init__(self, sample_rate=1.0):
+        self.sample_rate = sample_rate
+        self._local = local()
+        self._lock = Lock()
+        self._stages = {}
+        self._sampled_calls = 0
+        self._cprofile = None
+        self._cprofile_calls = 0
+        self._cprofile_lock = Lock()
+        self._cprofile_output = None
+
+    def capture(self, calls):
+        """ Capture a cProfile of the next `calls` calls
+
+        Any capture already running is replaced, once the call it is
+        profiling (if any) has ended.
+        """
+        with self._cprofile_lock, self._lock:
+            self._cprofile = cProfile.Profile()
+            self._cprofile_calls = calls
+            self._cprofile_output = None
+
+    def begin(self):
+        """ Start a call, deciding whether it is sampled and profiled """
+        self._local.sampled = random() < self.sample_rate
+        if self._local.sampled:
+            with self._lock:
+                self._sampled_calls += 1
+        self._local.profiling = False
+        if self._cprofile_calls > 0 and \
+                self._cprofile_lock.acquire(blocking=False):
+            # Only one thread at a time can use the cProfile, and the
+            # capture may have finished before this thread got the lock
+            if self._cprofile_calls > 0:
+                self._local.profiling = True
+                self._cprofile.enable()
+            else:
+                self._cprofile_lock.release()
+
+    def end(self):
+        """ Finish the call started by `begin` on this thread """
+        self._local.sampled = False
+        if self._local.profiling:
+            self._local.profiling = False
+            self._cprofile.disable()
+            with self._lock:
+                self._cprofile_calls -= 1
+                if self._cprofile_calls == 0:
+                    self._cprofile_output = self._format_cprofile()
+            self._cprofile_lock.release()
+
+    def is_sampling(self):
+        """ Return whether the current call on this thread is sampled """
+        return getattr(self._local, 'sampled', False)
+
+    def span(self, stage):
+        """ Return a context manager timing a stage of the current call """
+        if not self.is_sampling():
+            return NULL_SPAN
+        return _Span(self, stage)
+
+    def record(self, stage, elapsed):
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = {
+                    'count': 0, 'total': 0.0, 'max': 0.0}
+            stats['count'] += 1
+            stats['total'] += elapsed
+            stats['max'] = max(stats['max'], elapsed)
+
+    def stats(self):
+        """ Return the timing of each stage, in seconds, and any cProfile
+
+        The cProfile output is the 30 most expensive functions by
+        cumulative time, once every requested call has been captured.
+        """
+        with self._lock:
+            return {
+                'sample_rate': self.sample_rate,
+                'sampled_calls': self._sampled_calls,
+                'stages': {stage: dict(
+                    stats, avg=stats['total'] / stats['count'])
+                    for stage, stats in self._stages.items()},
+                'cprofile_pending': self._cprofile_calls,
+                'cprofile': self._cprofile_output,
+            }
+
+    def _format_cprofile(self):
+        output = io.StringIO()
+        pstats.Stats(self._cprofile, stream=output) \
+            .sort_stats('cumulative').print_stats(30)
+        return output.getvalue()
@@ -0,0 +1,92 @@
+from threading import Lock
+
+from nio.properties import PropertyHolder, StringProperty, ListProperty, \
+    FloatProperty, TimeDeltaProperty
+
+
+class ReplicaRegion(PropertyHolder):
+    region_name = StringProperty(title="Region Name", default="us-west-2")
+
+
+class ReplicaOptions(PropertyHolder):
+    regions = ListProperty(ReplicaRegion, title="Replica Regions", default=[])
+    probe_interval = TimeDeltaProperty(title="Probe Interval",
+                                       default={"seconds": 30})
+    hedge_after = FloatProperty(title="Hedge After (seconds)", default=None,
+                                allow_none=True)
+    max_error_rate = FloatProperty(title="Max Error Rate", default=0.5)
+
+
+class ReplicaRouter(object):
+    """ Tracks rolling latency and error rates of the replicas of a table.
+
+    Latency and error rate are exponentially weighted moving averages, so
+    recent requests count the most. A replica whose error rate is above
+    `max_error_rate` is unhealthy until enough successful requests (or
+    probes) bring it back down.
+    """
+
+    def __init__(self, regions, max_error_rate=0.5, alpha=0.2):
+        """ Create a router over some regions
+
+        Args:
+            regions (list): Region names, in order of preference when their
+                latencies are unknown or equal
+            max_error_rate (float): Error rate above which a region is
+                considered unhealthy
+            alpha (float): Weight of the newest sample in the moving
+                averages
+        """
+        self.regions = list(regions)
+        self.max_error_rate = max_error_rate
+        self.alpha = alpha
+        self._lock = Lock()
+        self._stats = {region: {
+            'latency': None,
+            'error_rate': 0.0,
+            'requests': 0,
+            'errors': 0,
+        } for region in self.regions}
+
+    def record(self, region, latency=None, error=False):
+        """ Record the outcome of a request to a region
+
+        Args:
+            region (str): The region the request went to
+            latency (float): How long a successful request took, in seconds
+            error (bool): Whether or not the request failed
+        """
+        with self._lock:
+            stats = self._stats[region]
+            stats['requests'] += 1
+            stats['error_rate'] += \
+                self.alpha * ((1.0 if error else 0.0) - stats['error_rate'])
+            if error:
+                stats['errors'] += 1
+            elif stats['latency'] is None:
+                stats['latency'] = latency
+            else:
+                stats['latency'] += self.alpha * (latency - stats['latency'])
+
+    def ranked(self):
+        """ Return the regions best first
+
+        Healthy regions come before unhealthy ones, then regions are sorted
+        by latency. Regions with no latency yet come after the ones with.
+        """
+        with self._lock:
+            return sorted(self.regions, key=self._rank_key)
+
+    def _rank_key(self, region):
+        stats = self._stats[region]
+        return (stats['error_rate'] > self.max_error_rate,
+                stats['latency'] is None,
+                stats['latency'] or 0.0,
+                self.regions.index(region))
+
+    def stats(self):
+        """ Return a copy of the stats of every region """
+        with self._lock:
+            return {region: dict(stats, healthy=(
+                stats['error_rate'] <= self.max_error_rate))
+                for region, stats in self._stats.items()}
@@ -0,0 +1,180 @@
+from decimal import Decimal, Inexact
+from unittest import TestCase, skipIf
+
+try:
+    import boto3
+    from botocore.stub import Stubber
+    from ..backends.aws_client import AWSClientBackend, TableRef
+except ImportError:
+    boto3 = None
+
+from ..backends import TableNotFound
+
+
+@skipIf(boto3 is None, "boto3 is not installed")
+class TestAWSClientBackend(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        client = boto3.session.Session(
+            aws_access_key_id='KEY',
+            aws_secret_access_key='SECRET',
+            region_name='us-east-1').client('dynamodb')
+        self.stubber = Stubber(client)
+        self.stubber.activate()
+        self.backend = AWSClientBackend('us-east-1', client=client)
+        self.table = TableRef('table', ('id', 'time'))
+
+    def tearDown(self):
+        self.stubber.assert_no_pending_responses()
+        self.stubber.deactivate()
+        super().tearDown()
+
+    def test_client_config(self):
+        """ Pool size and retries are set on the client """
+        backend = AWSClientBackend(
+            'us-east-1', aws_access_key_id='KEY',
+            aws_secret_access_key='SECRET',
+            endpoint_url='http://localhost:8000', pool_size=25,
+            retry_mode='adaptive', max_attempts=5, timeout=2)
+        config = backend.client.meta.config
+        self.assertEqual(config.max_pool_connections, 25)
+        self.assertEqual(config.retries['mode'], 'adaptive')
+        # max_attempts includes the first attempt
+        self.assertEqual(config.retries['total_max_attempts'], 5)
+        self.assertEqual(config.read_timeout, 2)
+        self.assertEqual(backend.client.meta.endpoint_url,
+                         'http://localhost:8000')
+
+    def test_stored_item(self):
+        """ Items are returned the way boto3 reads them back """
+        self.assertDictEqual(
+            self.backend.stored_item(self.table, {'id': 'a', 'time': 1}),
+            {'id': 'a', 'time': Decimal('1')})
+
+    def test_get_table(self):
+        self.stubber.add_response('describe_table', {'Table': {
+            'TableName': 'table',
+            'KeySchema': [
+                {'AttributeName': 'time', 'KeyType': 'RANGE'},
+                {'AttributeName': 'id', 'KeyType': 'HASH'},
+            ],
+        }}, {'TableName': 'table'})
+        self.stubber.add_client_error(
+            'describe_table', 'ResourceNotFoundException')
+        table = self.backend.get_table('table')
+        self.assertEqual(self.backend.key_schema(table), ['id', 'time'])
+        with self.assertRaises(TableNotFound):
+            self.backend.get_table('missing')
+
+    def test_create_table(self):
+        self.stubber.add_response('create_table', {'TableDescription': {
+            'TableName': 'table',
+            'KeySchema': [{'AttributeName': 'id', 'KeyType': 'HASH'}],
+        }}, {
+            'TableName': 'table',
+            'KeySchema': [{'AttributeName': 'id', 'KeyType': 'HASH'}],
+            'AttributeDefinitions': [
+                {'AttributeName': 'id', 'AttributeType': 'S'}],
+            'ProvisionedThroughput': {
+                'ReadCapacityUnits': 5, 'WriteCapacityUnits': 5},
+        })
+        self.stubber.add_response('describe_table', {'Table': {
+            'TableName': 'table', 'TableStatus': 'ACTIVE'}})
+        table = self.backend.create_table('table', 'id')
+        self.assertEqual(self.backend.table_status(table), 'ACTIVE')
+
+    def test_batch_write(self):
+        """ Items are written 25 at a time and unprocessed ones resent """
+        items = [{'id': str(i), 'time': i, 'half': 0.5} for i in range(26)]
+        request = [{'PutRequest': {'Item': {
+            'id': {'S': item['id']},
+            'time': {'N': str(item['time'])},
+            'half': {'N': '0.5'},
+        }}} for item in items]
+        self.stubber.add_response('batch_write_item', {
+            'UnprocessedItems': {'table': request[:1]},
+        }, {'RequestItems': {'table': request[:25]}})
+        self.stubber.add_response('batch_write_item', {
+            'UnprocessedItems': {},
+        }, {'RequestItems': {'table': request[:1]}})
+        self.stubber.add_response('batch_write_item', {},
+                                  {'RequestItems': {'table': request[25:]}})
+        self.backend.batch_write(self.table, items)
+
+    def test_inexact_float(self):
+        """ Like boto 2, floats that would be rounded are refused """
+        with self.assertRaises(Inexact):
+            self.backend.batch_write(self.table, [{'id': 'a', 'pi': 3.14}])
+        with self.assertRaises(Inexact):
+            self.backend.stored_item(self.table, {'id': 'a', 'pi': 3.14})
+        self.assertEqual(
+            self.backend.stored_item(self.table, {'pi': Decimal('3.14')}),
+            {'pi': Decimal('3.14')})
+
+    def test_query(self):
+        """ Queries are paginated until the limit is reached """
+        expected = {
+            'TableName': 'table',
+            'ScanIndexForward': False,
+            'KeyConditions': {
+                'id': {'AttributeValueList': [{'S': 'a'}],
+                       'ComparisonOperator': 'EQ'},
+                'time': {'AttributeValueList': [{'N': '1'}, {'N': '5'}],
+                         'ComparisonOperator': 'BETWEEN'},
+            },
+            'AttributesToGet': ['time'],
+            'Select': 'SPECIFIC_ATTRIBUTES',
+            'Limit': 3,
+        }
+        self.stubber.add_response('query', {
+            'Items': [{'time': {'N': '5'}}, {'time': {'N': '4'}}],
+            'LastEvaluatedKey': {'id': {'S': 'a'}, 'time': {'N': '4'}},
+        }, expected)
+        self.stubber.add_response('query', {
+            'Items': [{'time': {'N': '3'}}],
+            'LastEvaluatedKey': {'id': {'S': 'a'}, 'time': {'N': '3'}},
+        }, dict(expected, Limit=1, ExclusiveStartKey={
+            'id': {'S': 'a'}, 'time': {'N': '4'}}))
+        items = list(self.backend.query(self.table, {
+            'id__eq': 'a',
+            'time__between': [1, 5],
+            'reverse': True,
+            'limit': 3,
+            'attributes': ['time'],
+        }))
+        self.assertEqual(items, [{'time': Decimal(t)} for t in (5, 4, 3)])
+
+    def test_get_item(self):
+        self.stubber.add_response('get_item', {'Item': {'id': {'S': 'a'}}}, {
+            'TableName': 'table', 'Key': {'id': {'S': 'a'}},
+            'ConsistentRead': True})
+        self.stubber.add_response('get_item', {}, {
+            'TableName': 'table', 'Key': {'id': {'S': 'b'}},
+            'ConsistentRead': False, 'AttributesToGet': ['id']})
+        self.assertEqual(self.backend.get_item(
+            self.table, {'id': 'a'}, consistent=True), {'id': 'a'})
+        self.assertIsNone(self.backend.get_item(
+            self.table, {'id': 'b'}, attributes=['id']))
+
+    def test_batch_get(self):
+        self.stubber.add_response('batch_get_item', {
+            'Responses': {'table': [{'id': {'S': 'a'}}]},
+            'UnprocessedKeys': {'table': {'Keys': [{'id': {'S': 'b'}}]}},
+        }, {'RequestItems': {'table': {
+            'Keys': [{'id': {'S': 'a'}}, {'id': {'S': 'b'}}]}}})
+        self.stubber.add_response('batch_get_item', {
+            'Responses': {'table': [{'id': {'S': 'b'}}]},
+        }, {'RequestItems': {'table': {'Keys': [{'id': {'S': 'b'}}]}}})
+        self.assertEqual(
+            self.backend.batch_get(self.table, [{'id': 'a'}, {'id': 'b'}]),
+            [{'id': 'a'}, {'id': 'b'}])
+
+    def test_scan(self):
+        self.stubber.add_response('scan', {
+            'Items': [{'id': {'S': 'a'}}],
+        }, {'TableName': 'table', 'ScanFilter': {
+            'id': {'AttributeValueList': [{'S': 'a'}],
+                   'ComparisonOperator': 'BEGINS_WITH'}}})
+        items = self.backend.scan(self.table, id__beginswith='a')
+        self.assertEqual(list(items), [{'id': 'a'}])
@@ -1,10 +1,13 @@
-from unittest.mock import patch
+from threading import Event
+from time import sleep
+from unittest.mock import MagicMock, patch
 
 from nio.signal.base import Signal
 from nio.testing.block_test_case import NIOBlockTestCase
 from nio.util.discovery import not_discoverable
 
-from ..dynamo_db_base_block import DynamoDBBase
+from ..backends import Boto2Backend
+from ..dynamo_db_base_block import DynamoDBBase, BoundedConnectionPool
 
 
 @not_discoverable
@@ -22,8 +25,8 @@ class ExceptionDynamoDB(DynamoDBBase):
 
 
 @patch(DynamoDBBase.__module__ + '.connect_to_region')
-@patch(DynamoDBBase.__module__ + '.Table.create')
-@patch(DynamoDBBase.__module__ + '.Table.count')
+@patch(Boto2Backend.__module__ + '.Table.create')
+@patch(Boto2Backend.__module__ + '.Table.count')
 @patch('boto.dynamodb2.table.BatchTable.put_item')
 class TestDynamoDBBase(NIOBlockTestCase):
 
@@ -56,3 +59,128 @@ class TestDynamoDBBase(NIOBlockTestCase):
         self.assert_num_signals_notified(0)
 
         blk.stop()
+
+    def test_connect_endpoint(self, put_func, count_func, create_func,
+                              connect_func):
+        """ Connect to a custom endpoint with a custom region name """
+        connect_func.return_value.http_connection_kwargs = {}
+        blk = PassDynamoDB()
+        self.configure_block(blk, {
+            'creds': {'access_key': 'KEY', 'access_secret': 'SECRET'},
+            'connection': {
+                'region_name': 'local',
+                'endpoint': 'http://localhost:8000',
+                'timeout': 2.5,
+            }
+        })
+        connect_func.assert_called_once_with(
+            'local',
+            aws_access_key_id='KEY',
+            aws_secret_access_key='SECRET',
+            host='localhost',
+            port=8000,
+            is_secure=False)
+        self.assertDictEqual(blk._backend.connection.http_connection_kwargs,
+                             {'timeout': 2.5})
+
+    def test_parse_endpoint(self, put_func, count_func, create_func,
+                            connect_func):
+        parse = DynamoDBBase._parse_endpoint
+        self.assertEqual(parse('vpce.example.com', None, True),
+                         ('vpce.example.com', None, True))
+        self.assertEqual(parse('https://vpce.example.com', 8443, False),
+                         ('vpce.example.com', 8443, True))
+        self.assertEqual(parse('http://localhost:8000', None, True),
+                         ('localhost', 8000, False))
+
+    def test_connect_unknown_region(self, put_func, count_func, create_func,
+                                    connect_func):
+        """ Regions boto doesn't know about use the standard endpoint """
+        connect_func.return_value = None
+        blk = PassDynamoDB()
+        self.configure_block(blk, {
+            'connection': {'region_name': 'ap-new-1', 'pool_size': 2},
+        })
+        conn = blk._backend.connection
+        self.assertEqual(conn.host, 'dynamodb.ap-new-1.amazonaws.com')
+        self.assertEqual(conn.region.name, 'ap-new-1')
+        self.assertIsInstance(conn._pool, BoundedConnectionPool)
+
+    def test_bounded_pool(self, put_func, count_func, create_func,
+                          connect_func):
+        """ Idle connections beyond the pool size are closed """
+        pool = BoundedConnectionPool(2)
+        conns = [MagicMock() for _ in range(3)]
+        for conn in conns:
+            pool.put_http_connection('host', 443, True, conn)
+        self.assertEqual(pool.size(), 2)
+        conns[2].close.assert_called_once_with()
+        conns[0].close.assert_not_called()
+
+    def test_ingress_queue(self, put_func, count_func, create_func,
+                           connect_func):
+        """ Queued signals are processed by workers, overflow is dropped """
+        blk = PassDynamoDB()
+        self.configure_block(blk, {
+            'ingress': {'queue_size': 1, 'overflow': 'drop_newest'},
+        })
+        release = Event()
+        process = blk._process_signals
+        blk._process_signals = lambda sigs: release.wait(1) and process(sigs)
+        blk.start()
+        # the worker takes the first list, the second waits in the queue
+        # and the third overflows
+        for i in range(3):
+            blk.process_signals([Signal({'_id': i})])
+            sleep(0.05)
+        stats = blk.ingress_stats()
+        self.assertEqual(stats['depth'], 1)
+        self.assertEqual(stats['dropped'], 1)
+        release.set()
+        sleep(0.1)
+        self.assert_num_signals_notified(2)
+        self.assertEqual(blk.ingress_stats()['depth'], 0)
+        blk.stop()
+
+    def test_ingress_drain(self, put_func, count_func, create_func,
+                           connect_func):
+        """ Signals still queued when the block stops are processed """
+        blk = PassDynamoDB()
+        self.configure_block(blk, {
+            'ingress': {'queue_size': 5, 'drain_timeout': 1},
+        })
+        process = blk._process_signals
+        blk._process_signals = lambda sigs: sleep(0.05) or process(sigs)
+        blk.start()
+        for i in range(3):
+            blk.process_signals([Signal({'_id': i})])
+        blk.stop()
+        self.assert_num_signals_notified(3)
+
+    def test_profile(self, put_func, count_func, create_func, connect_func):
+        """ Stages of profiled signal lists are timed until profiling stops """
+        blk = PassDynamoDB()
+        self.configure_block(blk, {})
+        self.assertDictEqual(blk.stop_profile(), {})
+        blk.process_signals([Signal({'_id': 1})])
+        self.assertIsNone(blk._profiler)
+
+        stats = blk.profile(sample_rate=1, cprofile_calls=1)
+        self.assertEqual(stats['sampled_calls'], 0)
+        self.assertEqual(stats['cprofile_pending'], 1)
+        blk.process_signals([Signal({'_id': 1})])
+        blk.process_signals([Signal({'_id': 2})])
+        stats = blk.profile()
+        self.assertEqual(stats['sampled_calls'], 2)
+        for stage in ('grouping', 'lock_wait', 'table_lookup', 'notify'):
+            self.assertEqual(stats['stages'][stage]['count'], 2)
+        self.assertEqual(stats['cprofile_pending'], 0)
+        self.assertIn('_operate_on_signals', stats['cprofile'])
+
+        # calls that aren't sampled aren't timed
+        blk.profile(sample_rate=0)
+        blk.process_signals([Signal({'_id': 3})])
+        stats = blk.stop_profile()
+        self.assertEqual(stats['sampled_calls'], 2)
+        self.assertIsNone(blk._profiler)
+        self.assert_num_signals_notified(4)
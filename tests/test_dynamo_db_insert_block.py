@@ -1,12 +1,15 @@
+from decimal import Decimal
 from unittest.mock import MagicMock, patch
 from time import sleep
 from boto.exception import JSONResponseError
+from boto.dynamodb2.fields import HashKey, RangeKey
 
 from nio.signal.base import Signal
 from nio.testing.block_test_case import NIOBlockTestCase
 from nio.util.discovery import not_discoverable
 from nio.util.threading.spawn import spawn
 
+from ..backends import Boto2Backend
 from ..dynamo_db_insert_block import DynamoDBInsert
 from ..dynamo_db_base_block import DynamoDBBase
 
@@ -24,8 +27,8 @@ class SaveCounterDynamoDB(DynamoDBInsert):
 
 
 @patch(DynamoDBBase.__module__ + '.connect_to_region')
-@patch(DynamoDBBase.__module__ + '.Table.create')
-@patch(DynamoDBBase.__module__ + '.Table.count')
+@patch(Boto2Backend.__module__ + '.Table.create')
+@patch(Boto2Backend.__module__ + '.Table.count')
 @patch('boto.dynamodb2.table.BatchTable.put_item')
 class TestDynamoDBInsert(NIOBlockTestCase):
 
@@ -44,6 +47,48 @@ class TestDynamoDBInsert(NIOBlockTestCase):
             aws_access_key_id='FAKEKEY',
             aws_secret_access_key='FAKESECRET')
 
+    def test_item_cache(self, put_func, count_func, create_func,
+                        connect_func):
+        """ Successful writes populate the item cache, failures invalidate """
+        blk = DynamoDBInsert()
+        self.configure_block(blk, {
+            'hash_key': 'hash',
+            'range_key': 'range',
+            'item_cache': {'enabled': True, 'name': 'test_insert_cache'},
+        })
+        blk._key_schemas['signals'] = ['hash', 'range']
+        key = blk._get_cache_key('signals', {'hash': 'a', 'range': 1})
+        blk.process_signals([Signal({'hash': 'a', 'range': 1, 'v': 1})])
+        # items are cached the way boto reads them back
+        self.assertDictEqual(blk._item_cache.get(key), {
+            'hash': 'a', 'range': Decimal('1'), 'v': Decimal('1')})
+        # a failed batch drops the item rather than caching it
+        with patch('boto.dynamodb2.table.BatchTable.__exit__',
+                   side_effect=Exception):
+            blk.process_signals([Signal({'hash': 'a', 'range': 1, 'v': 2})])
+        self.assertIsNone(blk._item_cache.get(key))
+        self.assertEqual(blk.cache_stats()['invalidations'], 1)
+
+    def test_item_cache_table_schema(self, put_func, count_func, create_func,
+                                     connect_func):
+        """ Items are cached by the table's key, not the block's config """
+        blk = DynamoDBInsert()
+        self.configure_block(blk, {
+            'hash_key': 'id',
+            'item_cache': {'enabled': True, 'name': 'test_cache_schema'},
+        })
+        # the table's key schema isn't known
+        blk.process_signals([Signal({'id': 'a', 'time': 1})])
+        # the table has a range key the block isn't configured with
+        blk._key_schemas['signals'] = ['id', 'time']
+        blk.process_signals([Signal({'id': 'a', 'time': 2})])
+        self.assertIsNone(blk._item_cache.get(
+            blk._get_cache_key('signals', {'id': 'a', 'time': 1})))
+        self.assertIsNotNone(blk._item_cache.get(
+            blk._get_cache_key('signals', {'id': 'a', 'time': 2})))
+        self.assertIsNone(blk._get_cache_key('signals', {'id': 'a'}))
+        self.assertEqual(blk.cache_stats()['puts'], 1)
+
     def test_not_table(self, put_func, count_func, create_func, connect_func):
         """ Assert that tables that aren't found are created """
 
@@ -79,6 +124,22 @@ class TestDynamoDBInsert(NIOBlockTestCase):
         self.assertEqual(count_func.call_count, 2)
         self.assertEqual(create_func.call_count, 1)
 
+    def test_key_schema(self, put_func, count_func, create_func,
+                        connect_func):
+        """ The key schema of a table is cached along with the table """
+        count_func.side_effect = JSONResponseError(
+            400,
+            "{'message': 'Requested resource not found: Table: T notfound', "
+            "'__type': 'com.amazonaws.dynamodb.v20120810"
+            "#ResourceNotFoundException'}")
+        create_func.return_value.schema = [
+            HashKey('hash_attr'), RangeKey('range_attr')]
+        blk = DynamoDBInsert()
+        self.configure_block(blk, {})
+        blk._get_table('new_table')
+        self.assertEqual(blk._key_schemas['new_table'],
+                         ['hash_attr', 'range_attr'])
+
     def test_save_batch(self, put_func, count_func, create_func, connect_func):
         """ Make sure we save each table in a batch fashion """
         blk = SaveCounterDynamoDB()
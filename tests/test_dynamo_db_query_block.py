@@ -1,15 +1,23 @@
-from unittest.mock import patch
+import json
+from decimal import Decimal
+from threading import Event
+from time import sleep
+from unittest.mock import MagicMock, patch
+
+from boto.dynamodb2.exceptions import ItemNotFound
 
 from nio.signal.base import Signal
 from nio.testing.block_test_case import NIOBlockTestCase
 
+from ..backends import Boto2Backend
 from ..dynamo_db_query_block import DynamoDBQuery
 from ..dynamo_db_base_block import DynamoDBBase
+from ..dynamo_db_insert_block import DynamoDBInsert
 
 
 @patch(DynamoDBBase.__module__ + '.connect_to_region')
-@patch(DynamoDBBase.__module__ + '.Table.count')
-@patch(DynamoDBBase.__module__ + '.Table.query_2')
+@patch(Boto2Backend.__module__ + '.Table.count')
+@patch(Boto2Backend.__module__ + '.Table.query_2')
 class TestDynamoDBQuery(NIOBlockTestCase):
 
     def test_build_query_dict_default(self, q_func, count_func, connect_func):
@@ -108,3 +116,360 @@ class TestDynamoDBQuery(NIOBlockTestCase):
         q_func.return_value = [{'pi': 3.14}]
         blk.process_signals([Signal({'id': 1})])
         self.assert_last_signal_notified(Signal({'id': 1, 'pi': 3.14}))
+
+    @patch(Boto2Backend.__module__ + '.Table.get_item')
+    @patch('boto.dynamodb2.table.BatchTable.put_item')
+    def test_item_cache(self, put_func, get_func, q_func, count_func,
+                        connect_func):
+        """ Point reads are served from items cached by an insert block """
+        cache_config = {'enabled': True, 'name': 'test_item_cache'}
+        insert_blk = DynamoDBInsert()
+        self.configure_block(insert_blk, {
+            'hash_key': 'id',
+            'item_cache': cache_config,
+        })
+        blk = DynamoDBQuery()
+        self.configure_block(blk, {'item_cache': cache_config})
+        insert_blk._key_schemas['signals'] = blk._key_schemas['signals'] = \
+            ['id']
+        insert_blk.process_signals([Signal({'id': 1, 'pi': '3.14'})])
+        blk.process_signals([Signal({'id': 1})])
+        self.assertEqual(q_func.call_count, 0)
+        self.assert_last_signal_notified(Signal({'id': 1, 'pi': '3.14'}))
+        self.assertIsInstance(self.last_signal_notified().id, Decimal)
+        # items that weren't written go to the table
+        get_func.return_value = {'id': 2}
+        blk.process_signals([Signal({'id': 2})])
+        self.assertEqual(get_func.call_count, 1)
+        self.assertEqual(q_func.call_count, 0)
+        self.assertEqual(blk.cache_stats()['hits'], 1)
+        self.assertEqual(blk.cache_stats()['misses'], 1)
+
+    def test_item_cache_not_point_read(self, q_func, count_func,
+                                       connect_func):
+        """ Range queries are never served from the item cache """
+        blk = DynamoDBQuery()
+        self.configure_block(blk, {
+            'item_cache': {'enabled': True, 'name': 'test_not_point_read'},
+            'query_filters': [
+                {'key': 'id__eq', 'value': '{{ $id }}'},
+                {'key': 'time__gt', 'value': '0'},
+            ]
+        })
+        blk._key_schemas['signals'] = ['id']
+        blk._item_cache.put(
+            blk._get_cache_key('signals', {'id': 1}), {'id': 1})
+        q_func.return_value = []
+        blk.process_signals([Signal({'id': 1})])
+        self.assertEqual(q_func.call_count, 1)
+        self.assertEqual(blk.cache_stats()['hits'], 0)
+
+    def test_compact_output(self, q_func, count_func, connect_func):
+        """ Compact output notifies one signal per query with every result """
+        blk = DynamoDBQuery()
+        self.configure_block(blk, {'compact_output': True})
+        q_func.return_value = [{'pi': 3.14}, {'e': 2.72}]
+        blk.process_signals([Signal({'id': 1}), Signal({'id': 2})])
+        self.assert_num_signals_notified(2)
+        self.assert_last_signal_notified(
+            Signal({'results': [{'pi': 3.14}, {'e': 2.72}]}))
+        # the results are plain lists of dicts
+        self.assertEqual(json.dumps(self.last_signal_notified().to_dict()),
+                         '{"results": [{"pi": 3.14}, {"e": 2.72}]}')
+        # queries without results still notify a signal
+        q_func.return_value = []
+        blk.process_signals([Signal({'id': 3})])
+        self.assert_last_signal_notified(Signal({'results': []}))
+
+    def test_compact_output_enrich(self, q_func, count_func, connect_func):
+        """ Compact results are stored under the enrich field """
+        blk = DynamoDBQuery()
+        self.configure_block(blk, {
+            'compact_output': True,
+            'enrich': {'enrich_field': 'items', 'exclude_existing': False},
+        })
+        q_func.return_value = [{'pi': 3.14}]
+        blk.process_signals([Signal({'id': 1})])
+        self.assert_last_signal_notified(
+            Signal({'id': 1, 'items': [{'pi': 3.14}]}))
+
+    def test_compact_output_enrich_expression(self, q_func, count_func,
+                                              connect_func):
+        """ Enrich options are evaluated against each incoming signal """
+        blk = DynamoDBQuery()
+        self.configure_block(blk, {
+            'compact_output': True,
+            'enrich': {'enrich_field': 'items',
+                       'exclude_existing': '{{ $exclude }}'},
+        })
+        q_func.return_value = [{'pi': 3.14}]
+        blk.process_signals([Signal({'id': 1, 'exclude': False})])
+        self.assert_last_signal_notified(Signal(
+            {'id': 1, 'exclude': False, 'items': [{'pi': 3.14}]}))
+        blk.process_signals([Signal({'id': 2, 'exclude': True})])
+        self.assert_last_signal_notified(
+            Signal({'items': [{'pi': 3.14}]}))
+
+    def test_replica_routing(self, q_func, count_func, connect_func):
+        """ Queries go to the fastest replica and fail over to the next """
+        blk = DynamoDBQuery()
+        self.configure_block(blk, {
+            'region': 'us_east_1',
+            'replicas': {'regions': [{'region_name': 'us-west-2'}]},
+        })
+        connect_func.assert_any_call(
+            'us-west-2', aws_access_key_id='[[AMAZON_ACCESS_KEY_ID]]',
+            aws_secret_access_key='[[AMAZON_SECRET_ACCESS_KEY]]')
+        tables = {'us-east-1': MagicMock(), 'us-west-2': MagicMock()}
+        tables['us-east-1'].query_2.return_value = [{'region': 'east'}]
+        tables['us-west-2'].query_2.return_value = [{'region': 'west'}]
+        blk._get_replica_table = lambda region, table: tables[region]
+        blk._router.record('us-east-1', 0.2)
+        blk._router.record('us-west-2', 0.1)
+        blk.process_signals([Signal({'id': 1})])
+        self.assert_last_signal_notified(Signal({'region': 'west'}))
+        # a failed query is retried on the next replica
+        tables['us-west-2'].query_2.side_effect = Exception
+        blk.process_signals([Signal({'id': 1})])
+        self.assert_last_signal_notified(Signal({'region': 'east'}))
+        self.assertEqual(blk.replica_stats()['us-west-2']['errors'], 1)
+        self.assertEqual(blk.replica_stats()['us-east-1']['requests'], 2)
+
+    def test_replica_hedging(self, q_func, count_func, connect_func):
+        """ Slow queries are hedged to the second best replica """
+        blk = DynamoDBQuery()
+        self.configure_block(blk, {
+            'replicas': {
+                'regions': [{'region_name': 'us-west-2'}],
+                'hedge_after': 0.05,
+            },
+        })
+        slow = Event()
+        tables = {'us-east-1': MagicMock(), 'us-west-2': MagicMock()}
+        tables['us-east-1'].query_2.side_effect = \
+            lambda **kwargs: slow.wait(1) and [{'region': 'east'}]
+        tables['us-west-2'].query_2.return_value = [{'region': 'west'}]
+        blk._get_replica_table = lambda region, table: tables[region]
+        blk.process_signals([Signal({'id': 1})])
+        slow.set()
+        self.assert_last_signal_notified(Signal({'region': 'west'}))
+        self.assertEqual(tables['us-west-2'].query_2.call_count, 1)
+        blk.stop()
+
+    def test_replica_hedging_ingress(self, q_func, count_func,
+                                     connect_func):
+        """ Signals queued when the block stops can still be hedged """
+        blk = DynamoDBQuery()
+        self.configure_block(blk, {
+            'ingress': {'queue_size': 5, 'drain_timeout': 2},
+            'replicas': {
+                'regions': [{'region_name': 'us-west-2'}],
+                'hedge_after': 0.01,
+            },
+        })
+        tables = {'us-east-1': MagicMock(), 'us-west-2': MagicMock()}
+        tables['us-east-1'].query_2.side_effect = \
+            lambda **kwargs: sleep(0.1) or [{'region': 'east'}]
+        tables['us-west-2'].query_2.return_value = [{'region': 'west'}]
+        blk._get_replica_table = lambda region, table: tables[region]
+        blk.start()
+        for i in range(3):
+            blk.process_signals([Signal({'id': i})])
+        blk.stop()
+        self.assert_num_signals_notified(3)
+        self.assert_last_signal_notified(Signal({'region': 'west'}))
+
+    def test_replica_probe(self, q_func, count_func, connect_func):
+        """ Probes record the latency of each replica """
+        blk = DynamoDBQuery()
+        self.configure_block(blk, {
+            'replicas': {'regions': [{'region_name': 'us-west-2'}]},
+        })
+        blk._probe_replicas()
+        stats = blk.replica_stats()
+        self.assertEqual(stats['us-east-1']['requests'], 1)
+        self.assertEqual(stats['us-west-2']['requests'], 1)
+        self.assertIsNotNone(stats['us-west-2']['latency'])
+
+    def test_build_query_dict_projection(self, q_func, count_func,
+                                         connect_func):
+        blk = DynamoDBQuery()
+        self.configure_block(blk, {'projection': ['id', 'pi']})
+        query_dict = blk._build_query_dict(Signal({'id': 1}))
+        self.assertDictEqual(query_dict, {
+            'id__eq': 1,
+            'attributes': ['id', 'pi']
+        })
+
+    @patch(Boto2Backend.__module__ + '.Table.get_item')
+    def test_get_item(self, get_func, q_func, count_func, connect_func):
+        """ Primary key lookups use GetItem instead of a query """
+        blk = DynamoDBQuery()
+        self.configure_block(blk, {
+            'limit': 1,
+            'projection': ['pi'],
+            'query_filters': [
+                {'key': 'id__eq', 'value': '{{ $id }}'},
+                {'key': 'time__eq', 'value': '{{ $time }}'},
+            ]
+        })
+        blk._key_schemas['signals'] = ['id', 'time']
+        get_func.return_value = {'pi': 3.14}
+        blk.process_signals([Signal({'id': 1, 'time': 2})])
+        get_func.assert_called_once_with(
+            consistent=False, attributes=['pi'], id=1, time=2)
+        self.assertEqual(q_func.call_count, 0)
+        self.assert_last_signal_notified(Signal({'pi': 3.14}))
+        # a missing item is an empty result
+        get_func.side_effect = ItemNotFound
+        blk.process_signals([Signal({'id': 1, 'time': 3})])
+        self.assert_num_signals_notified(1)
+
+    @patch(Boto2Backend.__module__ + '.Table.get_item')
+    def test_get_item_not_key(self, get_func, q_func, count_func,
+                              connect_func):
+        """ Queries that are not a single item lookup still use query """
+        blk = DynamoDBQuery()
+        self.configure_block(blk, {'limit': '{{ $limit }}'})
+        q_func.return_value = []
+        # the schema isn't known yet
+        blk.process_signals([Signal({'id': 1, 'limit': 1})])
+        blk._key_schemas['signals'] = ['id', 'time']
+        # only part of the key is filtered on
+        blk.process_signals([Signal({'id': 1, 'limit': 1})])
+        blk._key_schemas['signals'] = ['id']
+        # more than one result is asked for
+        blk.process_signals([Signal({'id': 1, 'limit': 2})])
+        self.assertEqual(q_func.call_count, 3)
+        self.assertEqual(get_func.call_count, 0)
+
+    @patch(Boto2Backend.__module__ + '.Table.get_item')
+    def test_get_item_cache(self, get_func, q_func, count_func,
+                            connect_func):
+        """ Items fetched in full fill the item cache if configured to """
+        blk = DynamoDBQuery()
+        self.configure_block(blk, {
+            'item_cache': {'enabled': True, 'name': 'test_get_item_cache'},
+        })
+        blk._key_schemas['signals'] = ['id']
+        get_func.return_value = {'id': 1, 'pi': 3.14}
+        # by default reads stay eventually consistent and aren't cached
+        blk.process_signals([Signal({'id': 1})])
+        get_func.assert_called_once_with(
+            consistent=False, attributes=None, id=1)
+        self.assertEqual(blk.cache_stats()['fills'], 0)
+        get_func.reset_mock()
+        blk = DynamoDBQuery()
+        self.configure_block(blk, {
+            'item_cache': {'enabled': True, 'name': 'test_fill_on_read',
+                           'fill_on_read': True},
+        })
+        blk._key_schemas['signals'] = ['id']
+        blk.process_signals([Signal({'id': 1})])
+        blk.process_signals([Signal({'id': 1})])
+        # reads that fill the cache are strongly consistent
+        get_func.assert_called_once_with(
+            consistent=True, attributes=None, id=1)
+        self.assertEqual(blk.cache_stats()['hits'], 1)
+        self.assertEqual(blk.cache_stats()['fills'], 1)
+        self.assert_last_signal_notified(Signal({'id': 1, 'pi': 3.14}))
+
+    @patch(Boto2Backend.__module__ + '.Table.get_item')
+    @patch('boto.dynamodb2.table.BatchTable.put_item')
+    def test_get_item_cache_after_insert(self, put_func, get_func, q_func,
+                                         count_func, connect_func):
+        """ A read that finishes after an insert doesn't replace it """
+        cache_config = {'enabled': True, 'name': 'test_read_after_insert',
+                        'fill_on_read': True}
+        insert_blk = DynamoDBInsert()
+        self.configure_block(insert_blk, {
+            'hash_key': 'id',
+            'item_cache': cache_config,
+        })
+        blk = DynamoDBQuery()
+        self.configure_block(blk, {'item_cache': cache_config})
+        insert_blk._key_schemas['signals'] = blk._key_schemas['signals'] = \
+            ['id']
+
+        def get_item(**kwargs):
+            # the insert lands while the read is in flight
+            insert_blk.process_signals([Signal({'id': 1, 'v': 'new'})])
+            return {'id': 1, 'v': 'old'}
+
+        get_func.side_effect = get_item
+        blk.process_signals([Signal({'id': 1})])
+        self.assert_last_signal_notified(Signal({'id': 1, 'v': 'old'}))
+        blk.process_signals([Signal({'id': 1})])
+        self.assertEqual(get_func.call_count, 1)
+        self.assert_last_signal_notified(Signal({'id': 1, 'v': 'new'}))
+        self.assertEqual(blk.cache_stats()['fills'], 0)
+
+    @patch(Boto2Backend.__module__ + '.Table.get_item')
+    def test_get_item_cache_replicas(self, get_func, q_func, count_func,
+                                     connect_func):
+        """ Reads from replica regions never fill the item cache """
+        blk = DynamoDBQuery()
+        self.configure_block(blk, {
+            'region': 'us_east_1',
+            'item_cache': {'enabled': True, 'name': 'test_replica_cache',
+                           'fill_on_read': True},
+            'replicas': {'regions': [{'region_name': 'us-west-2'}]},
+        })
+        blk._key_schemas['signals'] = ['id']
+        tables = {'us-east-1': MagicMock(), 'us-west-2': MagicMock()}
+        for region, table in tables.items():
+            table.table_name = 'signals'
+            table.get_item.return_value = {'id': 1, 'region': region}
+        blk._get_replica_table = lambda region, table: tables[region]
+        blk._router.record('us-east-1', 0.2)
+        blk._router.record('us-west-2', 0.1)
+        blk.process_signals([Signal({'id': 1})])
+        tables['us-west-2'].get_item.assert_called_once_with(
+            consistent=False, attributes=None, id=1)
+        self.assertEqual(blk.cache_stats()['fills'], 0)
+        # the home region is read consistently and fills the cache
+        tables['us-west-2'].get_item.side_effect = Exception
+        blk.process_signals([Signal({'id': 2})])
+        tables['us-east-1'].get_item.assert_called_once_with(
+            consistent=True, attributes=None, id=2)
+        self.assertEqual(blk.cache_stats()['fills'], 1)
+
+    def test_memory_backend(self, q_func, count_func, connect_func):
+        """ Blocks on the memory backend share tables in the process """
+        insert_blk = DynamoDBInsert()
+        self.configure_block(insert_blk, {
+            'backend': 'memory',
+            'table': 'test_memory_backend',
+            'hash_key': 'id',
+            'range_key': 'time',
+        })
+        blk = DynamoDBQuery()
+        self.configure_block(blk, {
+            'backend': 'memory',
+            'table': 'test_memory_backend',
+            'reverse': True,
+            'query_filters': [
+                {'key': 'id__eq', 'value': '{{ $id }}'},
+                {'key': 'time__gt', 'value': '{{ 0 }}'},
+            ]
+        })
+        insert_blk.process_signals(
+            [Signal({'id': 'a', 'time': t}) for t in range(3)])
+        blk.process_signals([Signal({'id': 'a'})])
+        self.assert_num_signals_notified(2)
+        self.assert_last_signal_notified(Signal({'id': 'a', 'time': 1}))
+        self.assertEqual(q_func.call_count, 0)
+
+    def test_profile(self, q_func, count_func, connect_func):
+        """ Profiling times the query apart from building output signals """
+        q_func.return_value = iter([{'id': 1}, {'id': 2}])
+        blk = DynamoDBQuery()
+        self.configure_block(blk, {
+            'query_filters': [{'key': 'id__gt', 'value': '{{ 0 }}'}],
+        })
+        blk.profile()
+        blk.process_signals([Signal()])
+        stats = blk.stop_profile()
+        self.assertEqual(stats['stages']['network']['count'], 1)
+        self.assertEqual(stats['stages']['serialization']['count'], 1)
+        self.assert_num_signals_notified(2)
@@ -0,0 +1,117 @@
+import os
+from tempfile import mkdtemp
+from threading import Lock, Thread
+from time import sleep
+from unittest import TestCase
+
+from ..ingress_queue import IngressQueue, OverflowPolicy
+
+
+class TestIngressQueue(TestCase):
+
+    def test_fifo(self):
+        queue = IngressQueue(3)
+        for i in range(3):
+            self.assertTrue(queue.put(i))
+        self.assertEqual([queue.get() for _ in range(3)], [0, 1, 2])
+        self.assertIsNone(queue.get(timeout=0.01))
+        stats = queue.stats()
+        self.assertEqual(stats['enqueued'], 3)
+        self.assertEqual(stats['dequeued'], 3)
+        self.assertEqual(stats['depth'], 0)
+
+    def test_drop_newest(self):
+        queue = IngressQueue(2, OverflowPolicy.drop_newest)
+        self.assertEqual([queue.put(i) for i in range(3)],
+                         [True, True, False])
+        self.assertEqual([queue.get(), queue.get()], [0, 1])
+        self.assertEqual(queue.stats()['dropped'], 1)
+
+    def test_drop_oldest(self):
+        queue = IngressQueue(2, OverflowPolicy.drop_oldest)
+        self.assertEqual([queue.put(i) for i in range(3)],
+                         [True, True, True])
+        self.assertEqual([queue.get(), queue.get()], [1, 2])
+        self.assertEqual(queue.stats()['dropped'], 1)
+
+    def test_spill(self):
+        """ Overflowing items are spilled to disk and come out in order """
+        queue = IngressQueue(2, OverflowPolicy.spill)
+        for i in range(3):
+            queue.put(i)
+        self.assertEqual(queue.stats()['spill_depth'], 1)
+        self.assertEqual(queue.get(), 0)
+        # there is room again, but new items go after the spilled ones
+        queue.put(3)
+        self.assertEqual([queue.get() for _ in range(3)], [1, 2, 3])
+        self.assertEqual(queue.stats()['spilled'], 2)
+        self.assertEqual(queue.stats()['depth'], 0)
+
+    def test_block(self):
+        """ Producers wait for room when the queue is full """
+        queue = IngressQueue(1)
+        queue.put(0)
+        producer = Thread(target=queue.put, args=(1,))
+        producer.start()
+        sleep(0.05)
+        self.assertTrue(producer.is_alive())
+        self.assertEqual(queue.get(), 0)
+        producer.join(1)
+        self.assertFalse(producer.is_alive())
+        self.assertEqual(queue.get(), 1)
+        self.assertEqual(queue.stats()['blocked'], 1)
+        self.assertGreater(queue.stats()['max_wait'], 0)
+
+    def test_close(self):
+        """ Closing releases blocked producers and waiting consumers """
+        queue = IngressQueue(1, OverflowPolicy.spill)
+        queue.put(0)
+        queue.put(1)
+        self.assertEqual(queue.close(), 2)
+        self.assertIsNone(queue.get())
+        self.assertFalse(queue.put(2))
+
+    def test_spill_unpicklable(self):
+        """ Items that can't be pickled are dropped without leaving files """
+        spill_dir = mkdtemp()
+        queue = IngressQueue(1, OverflowPolicy.spill, spill_dir)
+        queue.put(0)
+        self.assertFalse(queue.put(Lock()))
+        self.assertTrue(queue.put(1))
+        self.assertEqual(queue.stats()['dropped'], 1)
+        self.assertEqual([queue.get(), queue.get()], [0, 1])
+        queue.close()
+        self.assertListEqual(os.listdir(spill_dir), [])
+        os.rmdir(spill_dir)
+
+    def test_spill_write_error(self):
+        """ Items that can't be written to disk are dropped """
+        queue = IngressQueue(1, OverflowPolicy.spill,
+                             os.path.join(mkdtemp(), 'missing'))
+        queue.put(0)
+        self.assertFalse(queue.put(1))
+        self.assertEqual(queue.stats()['dropped'], 1)
+        self.assertEqual(queue.stats()['depth'], 1)
+
+    def test_close_drain(self):
+        """ Consumers get to drain the queue before it is closed """
+        queue = IngressQueue(1, OverflowPolicy.spill)
+        for i in range(3):
+            queue.put(i)
+        got = []
+
+        def consume():
+            sleep(0.05)
+            while True:
+                item = queue.get()
+                if item is None:
+                    return
+                got.append(item)
+
+        consumer = Thread(target=consume)
+        consumer.start()
+        self.assertEqual(queue.close(1), 0)
+        consumer.join(1)
+        self.assertListEqual(got, [0, 1, 2])
+        # nothing is accepted while closing
+        self.assertFalse(queue.put(3))
@@ -0,0 +1,99 @@
+from unittest import TestCase
+
+from ..item_cache import ItemCache, get_item_cache
+
+
+LOCATION = ('memory', 'local', '', None)
+
+
+class TestItemCache(TestCase):
+
+    def test_get_put(self):
+        """ Items can be read back with the same table and key """
+        cache = ItemCache()
+        key = cache.make_key(LOCATION, 'table', {'id': 1})
+        self.assertIsNone(cache.get(key))
+        cache.put(key, {'id': 1, 'pi': 3.14})
+        self.assertDictEqual(cache.get(key), {'id': 1, 'pi': 3.14})
+        # a different table or key attribute is a different item
+        self.assertIsNone(
+            cache.get(cache.make_key(LOCATION, 'other', {'id': 1})))
+        self.assertIsNone(
+            cache.get(cache.make_key(LOCATION, 'table', {'_id': 1})))
+        # and so is the same table somewhere else
+        self.assertIsNone(cache.get(cache.make_key(
+            ('memory', 'us-west-2', '', None), 'table', {'id': 1})))
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 4)
+        self.assertEqual(stats['puts'], 1)
+        self.assertEqual(stats['size'], 1)
+
+    def test_copies(self):
+        """ Mutating a returned item does not change the cache """
+        cache = ItemCache()
+        key = cache.make_key(LOCATION, 'table', {'id': 1})
+        item = {'id': 1, 'tags': ['x']}
+        cache.put(key, item)
+        item['tags'].append('y')
+        cache.get(key)['id'] = 2
+        cache.get(key)['tags'].append('z')
+        self.assertDictEqual(cache.get(key), {'id': 1, 'tags': ['x']})
+
+    def test_lru_eviction(self):
+        """ The least recently used item is evicted when full """
+        cache = ItemCache(max_items=2)
+        keys = [cache.make_key(LOCATION, 'table', {'id': i}) for i in range(3)]
+        cache.put(keys[0], {'id': 0})
+        cache.put(keys[1], {'id': 1})
+        # touch the first item so the second is the oldest
+        cache.get(keys[0])
+        cache.put(keys[2], {'id': 2})
+        self.assertIsNotNone(cache.get(keys[0]))
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertIsNotNone(cache.get(keys[2]))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_fill(self):
+        """ Reads only fill missing items if nothing was written since """
+        cache = ItemCache()
+        key = cache.make_key(LOCATION, 'table', {'id': 1})
+        other_key = cache.make_key(LOCATION, 'table', {'id': 2})
+        generation = cache.generation()
+        self.assertTrue(cache.fill(key, {'id': 1, 'v': 'read'}, generation))
+        # a read never replaces a cached item
+        cache.put(key, {'id': 1, 'v': 'written'})
+        self.assertFalse(
+            cache.fill(key, {'id': 1, 'v': 'read'}, cache.generation()))
+        self.assertEqual(cache.get(key)['v'], 'written')
+        # nor fills an item when a write happened while it was read
+        generation = cache.generation()
+        cache.invalidate(key)
+        self.assertFalse(cache.fill(key, {'id': 1, 'v': 'read'}, generation))
+        self.assertIsNone(cache.get(key))
+        self.assertTrue(
+            cache.fill(other_key, {'id': 2}, cache.generation()))
+        self.assertEqual(cache.stats()['fills'], 2)
+        self.assertEqual(cache.stats()['puts'], 1)
+
+    def test_invalidate(self):
+        cache = ItemCache()
+        key = cache.make_key(LOCATION, 'table', {'id': 1})
+        cache.put(key, {'id': 1})
+        cache.invalidate(key)
+        # invalidating a missing item is not counted
+        cache.invalidate(key)
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(cache.stats()['invalidations'], 1)
+
+    def test_unhashable_key(self):
+        """ Keys with unhashable values can't be cached """
+        self.assertIsNone(
+            ItemCache.make_key(LOCATION, 'table', {'id': [1, 2]}))
+
+    def test_shared_by_name(self):
+        """ Caches are shared process-wide by name """
+        cache = get_item_cache('test_shared_by_name', 5)
+        self.assertIs(get_item_cache('test_shared_by_name', 10), cache)
+        self.assertEqual(cache.max_items, 5)
+        self.assertIsNot(get_item_cache('test_shared_other', 5), cache)
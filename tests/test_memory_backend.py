@@ -0,0 +1,89 @@
+from unittest import TestCase
+
+from ..backends import MemoryBackend, TableNotFound
+
+
+class TestMemoryBackend(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.backend = MemoryBackend(tables={})
+        self.table = self.backend.create_table('table', 'id', 'time')
+        self.backend.batch_write(self.table, [
+            {'id': 'a', 'time': t, 'val': t * 10} for t in range(5)] + [
+            {'id': 'b', 'time': 0, 'val': 'bee'}])
+
+    def test_tables(self):
+        self.assertIs(self.backend.get_table('table'), self.table)
+        self.assertEqual(self.backend.table_status(self.table), 'ACTIVE')
+        self.assertEqual(self.backend.key_schema(self.table), ['id', 'time'])
+        with self.assertRaises(TableNotFound):
+            self.backend.get_table('missing')
+        # other regions have their own tables
+        with self.assertRaises(TableNotFound):
+            MemoryBackend('other', tables=self.backend._tables).get_table(
+                'table')
+
+    def test_stored_item(self):
+        item = {'id': 'c', 'time': 0}
+        stored = self.backend.stored_item(self.table, item)
+        self.assertDictEqual(stored, item)
+        self.assertIsNot(stored, item)
+
+    def test_copies(self):
+        """ Nested values are never shared with the stored items """
+        item = {'id': 'c', 'time': 0, 'tags': ['x']}
+        self.backend.batch_write(self.table, [item])
+        item['tags'].append('y')
+        self.backend.get_item(self.table, {'id': 'c', 'time': 0})[
+            'tags'].append('z')
+        self.backend.get_item(self.table, {'id': 'c', 'time': 0},
+                              attributes=['tags'])['tags'].append('z')
+        self.assertEqual(self.backend.get_item(
+            self.table, {'id': 'c', 'time': 0})['tags'], ['x'])
+
+    def test_overwrite(self):
+        """ Writing an item with the same key replaces it """
+        self.backend.batch_write(self.table, [{'id': 'b', 'time': 0}])
+        self.assertDictEqual(
+            self.backend.get_item(self.table, {'id': 'b', 'time': 0}),
+            {'id': 'b', 'time': 0})
+
+    def test_query(self):
+        query = self.backend.query
+        self.assertEqual([item['time'] for item in query(self.table, {
+            'id__eq': 'a', 'time__gte': 2})], [2, 3, 4])
+        self.assertEqual([item['time'] for item in query(self.table, {
+            'id__eq': 'a', 'time__between': [1, 2]})], [1, 2])
+        self.assertEqual([item['time'] for item in query(self.table, {
+            'id__eq': 'a', 'reverse': True, 'limit': 2})], [4, 3])
+        self.assertEqual(query(self.table, {
+            'id__eq': 'b', 'attributes': ['val']}), [{'val': 'bee'}])
+        self.assertEqual(len(query(self.table, {'id__beginswith': 'a'})), 5)
+        with self.assertRaises(ValueError):
+            query(self.table, {'id__like': 'a'})
+
+    def test_get_item(self):
+        self.assertDictEqual(
+            self.backend.get_item(self.table, {'id': 'a', 'time': 1}),
+            {'id': 'a', 'time': 1, 'val': 10})
+        self.assertDictEqual(
+            self.backend.get_item(
+                self.table, {'id': 'a', 'time': 1}, attributes=['val']),
+            {'val': 10})
+        self.assertIsNone(
+            self.backend.get_item(self.table, {'id': 'a', 'time': 9}))
+
+    def test_batch_get(self):
+        items = self.backend.batch_get(self.table, [
+            {'id': 'a', 'time': 1},
+            {'id': 'b', 'time': 0},
+            {'id': 'c', 'time': 0},
+        ], attributes=['val'])
+        self.assertCountEqual(items, [{'val': 10}, {'val': 'bee'}])
+
+    def test_scan(self):
+        self.assertEqual(len(self.backend.scan(self.table)), 6)
+        self.assertEqual(len(self.backend.scan(self.table, limit=2)), 2)
+        self.assertEqual(self.backend.scan(self.table, val__gt=30),
+                         [{'id': 'a', 'time': 4, 'val': 40}])
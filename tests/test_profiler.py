@@ -0,0 +1,85 @@
+from threading import Thread
+from unittest import TestCase
+
+from ..profiler import NULL_SPAN, StageProfiler
+
+
+class TestStageProfiler(TestCase):
+
+    def test_spans(self):
+        """ Spans of sampled calls are aggregated by stage """
+        profiler = StageProfiler()
+        for _ in range(2):
+            profiler.begin()
+            self.assertTrue(profiler.is_sampling())
+            with profiler.span('network'):
+                pass
+            profiler.end()
+        profiler.record('network', 1.0)
+        stats = profiler.stats()
+        self.assertEqual(stats['sampled_calls'], 2)
+        network = stats['stages']['network']
+        self.assertEqual(network['count'], 3)
+        self.assertEqual(network['max'], 1.0)
+        self.assertAlmostEqual(network['avg'], network['total'] / 3)
+        self.assertIsNone(stats['cprofile'])
+
+    def test_not_sampled(self):
+        """ Calls that are not sampled get spans that do nothing """
+        profiler = StageProfiler(sample_rate=0)
+        self.assertIs(profiler.span('network'), NULL_SPAN)
+        profiler.begin()
+        self.assertFalse(profiler.is_sampling())
+        self.assertIs(profiler.span('network'), NULL_SPAN)
+        profiler.end()
+        self.assertDictEqual(profiler.stats()['stages'], {})
+        self.assertEqual(profiler.stats()['sampled_calls'], 0)
+
+    def test_sampling_per_thread(self):
+        """ A call sampled on one thread doesn't sample another thread """
+        profiler = StageProfiler()
+        profiler.begin()
+        sampling = []
+        thread = Thread(target=lambda: sampling.append(
+            profiler.is_sampling()))
+        thread.start()
+        thread.join()
+        self.assertListEqual(sampling, [False])
+        self.assertTrue(profiler.is_sampling())
+        profiler.end()
+        self.assertFalse(profiler.is_sampling())
+
+    def test_cprofile(self):
+        """ A cProfile of the requested number of calls is captured """
+        def work():
+            return sum(range(100))
+
+        profiler = StageProfiler(sample_rate=0)
+        profiler.capture(2)
+        for calls in range(3):
+            profiler.begin()
+            work()
+            profiler.end()
+            if calls == 0:
+                self.assertEqual(profiler.stats()['cprofile_pending'], 1)
+                self.assertIsNone(profiler.stats()['cprofile'])
+        stats = profiler.stats()
+        self.assertEqual(stats['cprofile_pending'], 0)
+        self.assertIn('work', stats['cprofile'])
+
+    def test_capture_while_profiling(self):
+        """ Re-arming waits for the call being profiled to end """
+        profiler = StageProfiler(sample_rate=0)
+        profiler.capture(1)
+        profiler.begin()
+        capture = Thread(target=profiler.capture, args=(2,))
+        capture.start()
+        capture.join(0.05)
+        self.assertTrue(capture.is_alive())
+        profiler.end()
+        capture.join(1)
+        self.assertFalse(capture.is_alive())
+        # the new capture still has every call to go
+        stats = profiler.stats()
+        self.assertEqual(stats['cprofile_pending'], 2)
+        self.assertIsNone(stats['cprofile'])
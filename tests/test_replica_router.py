@@ -0,0 +1,40 @@
+from unittest import TestCase
+
+from ..replica_router import ReplicaRouter
+
+
+class TestReplicaRouter(TestCase):
+
+    def test_ranked_by_latency(self):
+        """ Faster regions are ranked first """
+        router = ReplicaRouter(['home', 'near', 'far'])
+        # regions keep their order until latencies are known
+        self.assertEqual(router.ranked(), ['home', 'near', 'far'])
+        router.record('far', 0.3)
+        self.assertEqual(router.ranked(), ['far', 'home', 'near'])
+        router.record('home', 0.2)
+        router.record('near', 0.1)
+        self.assertEqual(router.ranked(), ['near', 'home', 'far'])
+
+    def test_rolling_latency(self):
+        router = ReplicaRouter(['home'], alpha=0.5)
+        router.record('home', 0.1)
+        router.record('home', 0.3)
+        self.assertAlmostEqual(router.stats()['home']['latency'], 0.2)
+
+    def test_unhealthy(self):
+        """ Regions with too many errors are ranked last until they recover
+        """
+        router = ReplicaRouter(['home', 'near'], max_error_rate=0.3,
+                               alpha=0.5)
+        router.record('home', 0.2)
+        router.record('near', 0.1)
+        router.record('near', error=True)
+        self.assertEqual(router.ranked(), ['home', 'near'])
+        self.assertFalse(router.stats()['near']['healthy'])
+        self.assertEqual(router.stats()['near']['errors'], 1)
+        # errors don't change the latency
+        self.assertEqual(router.stats()['near']['latency'], 0.1)
+        router.record('near', 0.1)
+        self.assertEqual(router.ranked(), ['near', 'home'])
+        self.assertTrue(router.stats()['near']['healthy'])